@@ -1,11 +1,18 @@
 # =========================================================
 # Imports
 # =========================================================
+import numpy as np
 import pandas as pd
 import backtrader as bt
 import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from dateutil.relativedelta import relativedelta
 
+from ema_engine import prepare_arrays, run_ema_strategy
+from m30_data import load_m30_frame
+
 # =========================================================
 # Strategy: EMA + Recovery + Reverse Add-on
 # =========================================================
@@ -121,16 +128,11 @@ class EMAStrategy(bt.Strategy):
 # CSV Loader
 # =========================================================
 def load_m30_csv(file_path, start_date=None, end_date=None):
-    df = pd.read_csv(file_path, sep="\t")
-    df['datetime'] = pd.to_datetime(df['<DATE>'].astype(str) + ' ' + df['<TIME>'].astype(str), format="%Y.%m.%d %H:%M:%S")
-    df = df.set_index('datetime')
-    df = df.rename(columns={'<OPEN>':'open','<HIGH>':'high','<LOW>':'low','<CLOSE>':'close','<TICKVOL>':'volume','<VOL>':'openinterest'})
-    df = df[['open','high','low','close','volume','openinterest']]
-
-    if start_date:
-        df = df[df.index >= pd.to_datetime(start_date)]
-    if end_date:
-        df = df[df.index <= pd.to_datetime(end_date)]
+    # 日期区间在加载时下推，区间外的行不会被物化
+    start = pd.to_datetime(start_date) if start_date else None
+    end = pd.to_datetime(end_date) if end_date else None
+    df = load_m30_frame(file_path, start, end, columns=['open','high','low','close','tickvol','vol'])
+    df = df.rename(columns={'tickvol':'volume','vol':'openinterest'})
     return df
 
 # =========================================================
@@ -235,41 +237,93 @@ new Chart(document.getElementById("equityChart"), {{
     print(f"HTML report generated: {filename}")
 
 # =========================================================
-# 网格搜索回测
+# 网格搜索回测（多进程）
 # =========================================================
-def grid_backtest(symbol, df, initial_shares=100):
-    results = []
+# 进程数：None = 自动（fast 引擎串行，backtrader 引擎用全部 CPU 核心），1 = 串行
+GRID_WORKERS = None
+# 网格引擎："fast" = ema_engine 数组引擎（结果与 backtrader 逐笔一致），"backtrader" = 参考实现
+GRID_ENGINE = "fast"
+
+# 每个 worker 进程只接收一次行情数据
+_grid_df = None
+_grid_arrays = None
+
+def _init_grid_worker(df):
+    global _grid_df, _grid_arrays
+    _grid_df = df
+    _grid_arrays = prepare_arrays(df) if GRID_ENGINE == "fast" else None
+
+# 净值曲线压缩：按分取整后差分 + zlib，解压后与 round(x, 2) 的原值完全一致
+def compress_equity(curve):
+    cents = np.rint(np.asarray(curve, dtype=np.float64) * 100).astype(np.int64)
+    return zlib.compress(np.diff(cents, prepend=0).tobytes())
+
+def decompress_equity(blob):
+    return (np.cumsum(np.frombuffer(zlib.decompress(blob), dtype=np.int64)) / 100).tolist()
+
+def run_strategy(df, initial_shares, stop_loss):
+    # 单组参数完整回测，返回 backtrader strategy（含全部指标 / 线数据）
+    take_profit = stop_loss
+    cerebro = bt.Cerebro()
+    data = bt.feeds.PandasData(dataname=df)
+    cerebro.adddata(data)
+    cerebro.broker.setcash(100000)
+    cerebro.broker.setcommission(commission=0.001)
+    cerebro.addstrategy(EMAStrategy, initial_shares=initial_shares, stop_loss_cash=stop_loss, take_profit_cash=take_profit)
+    return cerebro.run()[0]
+
+def rebuild_grid_point(df, result):
+    # 按需重建某个网格结果的完整 strategy 对象（网格本身不保留）
+    return run_strategy(df, result["initial_shares"], result["stop_loss_cash"])
+
+def _run_grid_point(initial_shares, stop_loss):
+    take_profit = stop_loss
+    if GRID_ENGINE == "fast":
+        trade_log, equity_curve = run_ema_strategy(_grid_arrays, initial_shares, stop_loss, take_profit)
+    else:
+        strat = run_strategy(_grid_df, initial_shares, stop_loss)
+        trade_log, equity_curve = strat.trade_log, strat.equity_curve
+
+    total_trades = len(trade_log)
+    wins = sum(1 for t in trade_log if t["PnL ($)"] > 0)
+    losses = total_trades - wins
+    total_pnl = round(sum(t["PnL ($)"] for t in trade_log),2)
+    win_rate = (wins / total_trades * 100) if total_trades else 0
+
+    # 只返回精简汇要 + 交易记录 + 压缩净值曲线，strategy 对象随即释放
+    return {
+        "fast_period": 9,
+        "slow_period": 21,
+        "initial_shares": initial_shares,
+        "stop_loss_cash": stop_loss,
+        "take_profit_cash": take_profit,
+        "recovery_mult": 2,
+        "Total Trades": total_trades,
+        "Win Rate (%)": round(win_rate,2),
+        "Total PnL": total_pnl,
+        "Winning Trades": wins,
+        "Losing Trades": losses,
+        "trade_log": trade_log,
+        "equity_z": compress_equity(equity_curve),
+    }
+
+def grid_backtest(symbol, df, initial_shares=100, workers=None):
     stop_loss_values = [round(0.1 + 0.5*i, 2) * initial_shares for i in range(int((5-0.1)/0.5)+1)]
-    for stop_loss in stop_loss_values:
-        take_profit = stop_loss
-        cerebro = bt.Cerebro()
-        data = bt.feeds.PandasData(dataname=df)
-        cerebro.adddata(data)
-        cerebro.broker.setcash(100000)
-        cerebro.broker.setcommission(commission=0.001)
-        cerebro.addstrategy(EMAStrategy, initial_shares=initial_shares, stop_loss_cash=stop_loss, take_profit_cash=take_profit)
-        strat = cerebro.run()[0]
-
-        total_trades = len(strat.trade_log)
-        wins = sum(1 for t in strat.trade_log if t["PnL ($)"] > 0)
-        losses = total_trades - wins
-        total_pnl = round(sum(t["PnL ($)"] for t in strat.trade_log),2)
-        win_rate = (wins / total_trades * 100) if total_trades else 0
-
-        results.append({
-            "fast_period": 9,
-            "slow_period": 21,
-            "initial_shares": initial_shares,
-            "stop_loss_cash": stop_loss,
-            "take_profit_cash": take_profit,
-            "recovery_mult": 2,
-            "Total Trades": total_trades,
-            "Win Rate (%)": round(win_rate,2),
-            "Total PnL": total_pnl,
-            "Winning Trades": wins,
-            "Losing Trades": losses,
-            "strategy_obj": strat
-        })
+    if GRID_ENGINE == "fast":
+        # 单组参数只需毫秒级，进程池启动和传输数据的开销反而更大
+        workers = workers or GRID_WORKERS or 1
+    else:
+        workers = workers or GRID_WORKERS or os.cpu_count() or 1
+    shares_list = [initial_shares] * len(stop_loss_values)
+
+    if workers == 1:
+        _init_grid_worker(df)
+        results = list(map(_run_grid_point, shares_list, stop_loss_values))
+    else:
+        # map 保持 stop_loss 顺序，排序结果与串行完全一致
+        with ProcessPoolExecutor(max_workers=min(workers, len(stop_loss_values)),
+                                 initializer=_init_grid_worker, initargs=(df,)) as ex:
+            results = list(ex.map(_run_grid_point, shares_list, stop_loss_values))
 
     results_sorted = sorted(results, key=lambda x: x["Total PnL"])
     mid_index = len(results_sorted)//2
@@ -345,7 +399,6 @@ def run():
     generate_grid_html(symbol, grid_results)
 
     # 中位结果单策略报告
-    strat = mid_result["strategy_obj"]
     params = {
         "fast_period": mid_result["fast_period"],
         "slow_period": mid_result["slow_period"],
@@ -354,8 +407,8 @@ def run():
         "take_profit_cash": mid_result["take_profit_cash"],
         "recovery_mult": mid_result["recovery_mult"]
     }
-    pd.DataFrame(strat.trade_log).to_csv(f"{symbol}_Mid_Result_Trades.csv", index=False)
-    generate_html(symbol, params, strat.equity_curve, strat.trade_log)
+    pd.DataFrame(mid_result["trade_log"]).to_csv(f"{symbol}_Mid_Result_Trades.csv", index=False)
+    generate_html(symbol, params, decompress_equity(mid_result["equity_z"]), mid_result["trade_log"])
 
     print("Grid Backtest finished")
 
@@ -0,0 +1,212 @@
+import math
+
+# =========================================================
+# EMAStrategy 数组引擎（与 backtrader 回测逐笔一致）
+# =========================================================
+# 复现 backtes_ema.EMAStrategy 在 BackBroker 默认设置下的行为：
+#   市价单在下一根 bar 开盘价成交
+#   成交前先按下单 bar 收盘价做资金预检（checksubmit），现金不足则拒单（Margin）
+#   开仓成交时现金不足同样拒单；佣金 = |size| * commission * price
+#   净值 = cash + 持仓市值（空头按负市值计，shortcash）
+#   EMA 以前 period 根收盘价的 SMA（fsum）为种子
+# 浮点运算顺序与 backtrader 源码保持一致，trade_log / equity_curve 逐位相同
+# backtrader 版本仍作为参考实现，本引擎用于网格搜索
+
+
+def bt_ema(close, period):
+    # 与 bt.ind.EMA 的 once() 计算一致：前 period-1 根为 NaN
+    alpha = 2.0 / (1.0 + period)
+    alpha1 = 1.0 - alpha
+    out = [math.nan] * len(close)
+    if len(close) < period:
+        return out
+    prev = out[period - 1] = math.fsum(close[:period]) / period
+    for i in range(period, len(close)):
+        out[i] = prev = prev * alpha1 + close[i] * alpha
+    return out
+
+
+def prepare_arrays(df, fast_period=9, slow_period=21):
+    # 同一份行情多组参数回测时只准备一次
+    close = df["close"].tolist()
+    return {
+        "open": df["open"].tolist(),
+        "close": close,
+        "times": df.index.strftime("%Y-%m-%d %H:%M").tolist(),
+        "fast_period": fast_period,
+        "slow_period": slow_period,
+        "ema_fast": bt_ema(close, fast_period),
+        "ema_slow": bt_ema(close, slow_period),
+    }
+
+
+def _split(pos_size, size):
+    # Position.update 的 (opened, closed) 拆分
+    new_size = pos_size + size
+    if not new_size:
+        return 0, size
+    if not pos_size:
+        return size, 0
+    if (pos_size > 0) == (size > 0):
+        return size, 0
+    if (new_size > 0) == (pos_size > 0):
+        return 0, size
+    return new_size, -pos_size
+
+
+def _update_price(pos_size, pos_price, size, price):
+    new_size = pos_size + size
+    if not new_size:
+        return 0.0
+    if not pos_size:
+        return price
+    if (pos_size > 0) == (size > 0):
+        return (pos_price * pos_size + size * price) / new_size
+    if (new_size > 0) == (pos_size > 0):
+        return pos_price
+    return price
+
+
+def run_ema_strategy(arrays, initial_shares=100, stop_loss_cash=10.0, take_profit_cash=10.0,
+                     recovery_mult=2, max_capital_pct=0.9, cash=100000.0, commission=0.001):
+    # 返回 (trade_log, equity_curve)，与 EMAStrategy 的同名属性一致
+    opens = arrays["open"]
+    closes = arrays["close"]
+    times = arrays["times"]
+    ema_fast = arrays["ema_fast"]
+    ema_slow = arrays["ema_slow"]
+    first = max(arrays["fast_period"], arrays["slow_period"]) - 1
+
+    trade_log = []
+    equity_curve = []
+    pos_size = 0
+    pos_price = 0.0
+    order = None  # (size, 下单 bar 收盘价)
+    entry = None
+    in_recovery = False
+    recovery_shares = initial_shares
+    last_dir = None
+
+    for i in range(len(closes)):
+        close = closes[i]
+
+        # ---- broker.next：资金预检 + 开盘成交 ----
+        done = None
+        if order is not None:
+            size, created = order
+            order = None
+            opened, closed = _split(pos_size, size)
+
+            # checksubmit 伪成交（按下单价，平仓部分不计盈亏）
+            c = cash
+            if closed:
+                c += -closed * created
+                c -= abs(closed) * commission * created
+            if opened:
+                c -= opened * created
+                c -= abs(opened) * commission * created
+
+            if c >= 0.0:
+                price = opens[i]
+                c = cash
+                if closed:
+                    pnl = -closed * (price - pos_price)
+                    c += -closed * pos_price + pnl
+                    c -= abs(closed) * commission * price
+                    cash = c
+                if opened:
+                    c -= opened * price
+                    c -= abs(opened) * commission * price
+                    if c < 0.0:
+                        opened = 0
+                    else:
+                        cash = c
+                exec_size = closed + opened
+                if exec_size:
+                    pos_price = _update_price(pos_size, pos_price, exec_size, price)
+                    pos_size += exec_size
+                    done = (exec_size, exec_size * price / exec_size)
+
+        # ---- 净值 ----
+        dvalue = pos_size * close
+        if dvalue > 0:
+            unrealized = pos_size * (close - pos_price)
+            value = cash + ((dvalue - unrealized) + unrealized)
+        else:
+            value = cash + dvalue
+
+        # ---- notify_order ----
+        if done is not None:
+            size, price = done
+            direction = "LONG" if size > 0 else "SHORT"
+            dt_str = times[i]
+
+            if pos_size != 0:
+                if entry is None:
+                    entry = {"Entry Date": dt_str, "Direction": direction, "Shares": abs(size), "Entry Price": round(price, 2)}
+                else:
+                    prev_qty = entry["Shares"]
+                    prev_price = entry["Entry Price"]
+                    new_qty = abs(size)
+                    weighted_price = (prev_price * prev_qty + price * new_qty) / (prev_qty + new_qty)
+                    entry["Shares"] += new_qty
+                    entry["Entry Price"] = round(weighted_price, 2)
+
+            if pos_size == 0 and entry:
+                qty = entry["Shares"]
+                pnl = (price - entry["Entry Price"]) * qty if entry["Direction"] == "LONG" else (entry["Entry Price"] - price) * qty
+
+                if pnl < 0:
+                    in_recovery = True
+                    recovery_shares = entry["Shares"] * recovery_mult
+                else:
+                    in_recovery = False
+                    recovery_shares = initial_shares
+
+                last_dir = entry["Direction"]
+
+                trade_log.append({
+                    "Entry Date": entry["Entry Date"],
+                    "Exit Date": dt_str,
+                    "Direction": entry["Direction"],
+                    "Shares": qty,
+                    "Entry Price": entry["Entry Price"],
+                    "Exit Price": round(price, 2),
+                    "PnL ($)": round(pnl, 2),
+                    "Equity After Close": round(value, 2),
+                })
+                entry = None
+
+        if i < first:
+            continue
+
+        # ---- strategy.next ----
+        equity_curve.append(round(value, 2))
+
+        # 持仓止损/止盈
+        if pos_size:
+            shares = abs(pos_size)
+            pnl = (close - pos_price) * shares if pos_size > 0 else (pos_price - close) * shares
+            scale = shares / initial_shares
+            if pnl <= -stop_loss_cash * scale or pnl >= take_profit_cash * scale:
+                order = (-pos_size, close)
+            continue
+
+        # 反向加仓
+        if in_recovery:
+            if last_dir:
+                shares = recovery_shares
+                if abs(close * shares) <= value * max_capital_pct:
+                    order = (-shares if last_dir == "LONG" else shares, close)
+            continue
+
+        # 正常 EMA 开仓
+        shares = initial_shares
+        if not abs(close * shares) <= value * max_capital_pct:
+            continue
+        if ema_fast[i] > ema_slow[i]:
+            order = (shares, close)
+        elif ema_fast[i] < ema_slow[i]:
+            order = (-shares, close)
+
+    return trade_log, equity_curve
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# =========================================================
+# 回望网格结果持久化缓存（SQLite）
+# =========================================================
+# 键：回望窗口内容哈希（close + 信号）+ 策略常量 + cash_base
+#   直接对窗口数据取哈希，等价于“数据文件哈希 + 窗口边界”，
+#   且 START_DATE 改变导致 EMA 起点不同时不会误命中
+# 值：run_single_backtest 的净盈亏
+# 超过 max_entries 时按最近使用时间（LRU）淘汰
+CACHE_VERSION = 1
+DEFAULT_MAX_ENTRIES = 500_000
+
+_CACHES = {}
+
+
+class GridCache:
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS grid_pnl ("
+            "key TEXT PRIMARY KEY, pnl REAL NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS grid_pnl_lru ON grid_pnl (last_used)")
+        self.conn.commit()
+        self._rows = self.conn.execute("SELECT COUNT(*) FROM grid_pnl").fetchone()[0]
+
+    def get_many(self, keys):
+        found = {}
+        for a in range(0, len(keys), 500):
+            chunk = keys[a:a + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update(self.conn.execute(
+                f"SELECT key, pnl FROM grid_pnl WHERE key IN ({marks})", chunk).fetchall())
+        if found:
+            now = time.time_ns()
+            self.conn.executemany("UPDATE grid_pnl SET last_used = ? WHERE key = ?",
+                                  [(now, k) for k in found])
+            self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        now = time.time_ns()
+        cur = self.conn.executemany(
+            "INSERT OR REPLACE INTO grid_pnl (key, pnl, last_used) VALUES (?, ?, ?)",
+            [(k, float(v), now) for k, v in items])
+        self.conn.commit()
+        self._rows += max(cur.rowcount, 0)
+        if self._rows > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        # 淘汰到上限的 90%，避免每次写入都触发
+        self._rows = self.conn.execute("SELECT COUNT(*) FROM grid_pnl").fetchone()[0]
+        excess = self._rows - int(self.max_entries * 0.9)
+        if excess <= 0 or self._rows <= self.max_entries:
+            return
+        self.conn.execute(
+            "DELETE FROM grid_pnl WHERE key IN "
+            "(SELECT key FROM grid_pnl ORDER BY last_used LIMIT ?)", (excess,))
+        self.conn.commit()
+        self.evictions += excess
+        self._rows -= excess
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": self._rows,
+        }
+
+
+def get_grid_cache(path, max_entries=DEFAULT_MAX_ENTRIES):
+    # 每个进程各自持有连接（进程池 worker 中首次使用时打开）
+    key = (os.getpid(), os.path.abspath(path))
+    cache = _CACHES.get(key)
+    if cache is None:
+        cache = _CACHES[key] = GridCache(path, max_entries)
+    return cache
+
+
+def window_key(close, signal, params):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(np.ascontiguousarray(close, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(signal, dtype=np.int8).tobytes())
+    h.update(json.dumps({"version": CACHE_VERSION, **params}, sort_keys=True, default=float).encode())
+    return h.hexdigest()
+
+
+def cached_grid_pnls(path, close, signal, cash_bases, params, compute, partial=True, stats=None):
+    # 返回与 cash_bases 对应的 PnL 列表；只对未命中的 cash_base 调用 compute(missing)
+    # partial=False 时只要有未命中就对全部 cash_bases 重新计算（结果依赖整组候选时使用）
+    # stats：dict，累加本次调用的 hits / misses / evictions
+    #   （GridCache 计数留在各 worker 进程内，需随结果返回由调用方汇总）
+    if path is None:
+        return compute(cash_bases)
+
+    cache = get_grid_cache(path)
+    base = window_key(close, signal, params)
+    keys = [f"{base}:{float(cb)!r}" for cb in cash_bases]
+    found = cache.get_many(keys)
+    missing = [i for i, k in enumerate(keys) if k not in found]
+    hits = len(keys) - len(missing)
+    evictions = cache.evictions
+    if missing and not partial:
+        missing = list(range(len(keys)))
+    if missing:
+        pnls = compute([cash_bases[i] for i in missing])
+        cache.put_many([(keys[i], p) for i, p in zip(missing, pnls)])
+        found.update((keys[i], float(p)) for i, p in zip(missing, pnls))
+    if stats is not None:
+        stats["hits"] = stats.get("hits", 0) + hits
+        stats["misses"] = stats.get("misses", 0) + len(keys) - hits
+        stats["evictions"] = stats.get("evictions", 0) + cache.evictions - evictions
+    return [found[k] for k in keys]
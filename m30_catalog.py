@@ -0,0 +1,93 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from m30_data import load_m30_columns, m30_frame
+
+# =========================================================
+# 数据目录索引：<SYMBOL>_<TF>_<起始>_<结束>.csv
+# =========================================================
+# 文件名已包含品种、周期和覆盖区间（YYYYMMDDHHMM，含端点），
+# 扫描目录时只解析文件名，不打开任何文件
+DATA_FILE_RE = re.compile(r"^(?P<symbol>[A-Za-z0-9.]+)_(?P<timeframe>[MHDWN]\d+)_(?P<start>\d{12})_(?P<end>\d{12})\.csv$")
+
+_CATALOGS = {}
+
+
+def scan_catalog(data_dir="."):
+    # 返回 {symbol: [entry, ...]}，entry 按覆盖结束时间升序
+    catalog = {}
+    for name in os.listdir(data_dir):
+        m = DATA_FILE_RE.match(name)
+        if not m:
+            continue
+        entry = {
+            "symbol": m["symbol"],
+            "timeframe": m["timeframe"],
+            "start": pd.to_datetime(m["start"], format="%Y%m%d%H%M"),
+            "end": pd.to_datetime(m["end"], format="%Y%m%d%H%M"),
+            "path": os.path.join(data_dir, name),
+        }
+        catalog.setdefault(entry["symbol"], []).append(entry)
+    for entries in catalog.values():
+        entries.sort(key=lambda e: (e["end"], e["start"]))
+    return catalog
+
+
+def get_catalog(data_dir=".", refresh=False):
+    # 同一进程内每个目录只扫描一次
+    key = os.path.abspath(data_dir)
+    if refresh or key not in _CATALOGS:
+        _CATALOGS[key] = scan_catalog(data_dir)
+    return _CATALOGS[key]
+
+
+def find_files(catalog, symbol, start=None, end=None, timeframe="M30"):
+    # 选出与 [start, end] 有交集的文件，并剔除覆盖范围已被更新导出完全包含的文件
+    # 返回顺序：旧导出在前、新导出在后（合并时新导出优先）
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    candidates = []
+    for e in catalog.get(symbol, []):
+        if e["timeframe"] != timeframe:
+            continue
+        if (start is not None and e["end"] < start) or (end is not None and e["start"] > end):
+            continue
+        lo = e["start"] if start is None else max(e["start"], start)
+        hi = e["end"] if end is None else min(e["end"], end)
+        candidates.append((e, lo, hi))
+
+    chosen = []
+    for e, lo, hi in reversed(candidates):
+        if any(c_lo <= lo and hi <= c_hi for _, c_lo, c_hi in chosen):
+            continue
+        chosen.append((e, lo, hi))
+    return [e for e, _, _ in reversed(chosen)]
+
+
+def load_symbol_columns(symbol, start=None, end=None, columns=None, timeframe="M30",
+                        data_dir=".", catalog=None):
+    # 按品种和时间区间自动选文件；多个导出重叠时按时间去重合并（新导出优先）
+    catalog = get_catalog(data_dir) if catalog is None else catalog
+    files = find_files(catalog, symbol, start, end, timeframe)
+    if not files:
+        raise FileNotFoundError(f"no {timeframe} data for {symbol} in {data_dir}")
+
+    parts = [load_m30_columns(e["path"], start, end, columns) for e in files]
+    if len(parts) == 1:
+        return parts[0]
+
+    merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    # 倒序后 np.unique 取首次出现 = 原顺序中最后（最新导出）的那一行
+    rev_time = merged["time"][::-1]
+    _, idx = np.unique(rev_time, return_index=True)
+    idx = len(rev_time) - 1 - idx
+    return {k: v[idx] for k, v in merged.items()}
+
+
+def load_symbol_frame(symbol, start=None, end=None, columns=None, timeframe="M30",
+                      data_dir=".", catalog=None):
+    return m30_frame(load_symbol_columns(symbol, start, end, columns, timeframe, data_dir, catalog))
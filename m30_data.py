@@ -0,0 +1,384 @@
+import hashlib
+import io
+import os
+import struct
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# MT5 M30 导出数据（<DATE>\t<TIME>\t<OPEN>...）列式二进制缓存
+# =========================================================
+# 缓存文件与 CSV 同目录：BOIL_M30_....csv -> BOIL_M30_....csv.npz
+# 时间列为 int64 纳秒时间戳，OHLC 为 float64，量 / 点差为 int64
+# npz 不压缩（np.savez），读取时各列直接内存映射，按时间区间切片只触及区间内的页
+# 源文件 mtime / size 变化时自动失效：若只是在末尾追加了新 bar，则只解析新增尾部
+# （已摄入前缀的哈希不变才按追加处理，否则整表重建）
+CACHE_SUFFIX = ".npz"
+# 已摄入前缀的校验：blake2b 摘要长度与分块读取大小
+DIGEST_SIZE = 16
+HASH_BLOCK = 1 << 20
+
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+COUNT_COLUMNS = ["tickvol", "vol", "spread"]
+CSV_COLUMNS = {
+    "<OPEN>": "open", "<HIGH>": "high", "<LOW>": "low", "<CLOSE>": "close",
+    "<TICKVOL>": "tickvol", "<VOL>": "vol", "<SPREAD>": "spread",
+}
+
+
+def cache_path(csv_path):
+    return str(csv_path) + CACHE_SUFFIX
+
+
+def source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def _column_names(columns):
+    names = PRICE_COLUMNS + COUNT_COLUMNS if columns is None else list(columns)
+    return [name for name in CSV_COLUMNS.values() if name in names]
+
+
+def parse_m30_csv(source, columns=None):
+    # source 为文件路径或包含表头的文件对象；只解析所需列，显式指定 dtype
+    names = _column_names(columns)
+    src_of = {name: src for src, name in CSV_COLUMNS.items()}
+    usecols = ["<DATE>", "<TIME>"] + [src_of[n] for n in names]
+    dtype = {"<DATE>": str, "<TIME>": str}
+    dtype.update({src_of[n]: (np.float64 if n in PRICE_COLUMNS else np.int64) for n in names})
+    df = pd.read_csv(source, sep="\t", usecols=lambda c: c in usecols, dtype=dtype)
+
+    stamp = pd.to_datetime(df["<DATE>"] + " " + df["<TIME>"], format="%Y.%m.%d %H:%M:%S")
+    cols = {"time": stamp.to_numpy(dtype="datetime64[ns]").view(np.int64)}
+    for name in names:
+        src = src_of[name]
+        dt = np.float64 if name in PRICE_COLUMNS else np.int64
+        cols[name] = df[src].to_numpy(dtype=dt) if src in df else np.zeros(len(df), dtype=dt)
+    return cols
+
+
+# =========================================================
+# 日期区间下推
+# =========================================================
+def label_bounds(start=None, end=None):
+    # 与 df.loc[start:end] 的部分字符串索引一致：
+    # "2026-01-01" 作为结束时包含当天全部 bar
+    def bound(label, edge):
+        if label is None:
+            return None
+        if isinstance(label, str):
+            period = pd.Period(label)
+            return period.start_time if edge == "start" else period.end_time
+        return pd.Timestamp(label)
+    return bound(start, "start"), bound(end, "end")
+
+
+def _line_key(ts):
+    # 文件中 "YYYY.MM.DD\tHH:MM:SS" 定长前缀，字典序即时间顺序
+    return ts.strftime("%Y.%m.%d\t%H:%M:%S").encode()
+
+
+def _first_line_at_or_after(f, key, lo, hi):
+    # 二分查找文件偏移：返回 [lo, hi) 中第一条时间键 >= key 的行首（不存在则返回 hi）
+    # lo 必须为行首
+    n = len(key)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if mid > lo:
+            f.seek(mid - 1)
+            f.readline()
+            pos = f.tell()
+        else:
+            pos = lo
+        if pos >= hi:
+            break
+        f.seek(pos)
+        line = f.readline()
+        if line[:n] >= key:
+            hi = pos
+        else:
+            lo = pos + len(line)
+
+    # 剩余区间不超过两行，顺序扫描
+    f.seek(lo)
+    pos = lo
+    while pos < hi:
+        line = f.readline()
+        if not line or line[:n] >= key:
+            break
+        pos += len(line)
+    return min(pos, hi)
+
+
+def read_m30_range(csv_path, start=None, end=None, columns=None):
+    # 不经缓存：按文件偏移定位 [start, end]（含端点）对应的字节区间，只解析这部分行
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+
+        a = data_start
+        if start is not None:
+            a = _first_line_at_or_after(f, _line_key(pd.Timestamp(start).ceil("s")), data_start, size)
+        b = size
+        if end is not None:
+            # 第一条 > end 的行：键 >= end + 1 秒
+            b = _first_line_at_or_after(f, _line_key(pd.Timestamp(end).floor("s") + pd.Timedelta(seconds=1)), a, size)
+
+        f.seek(a)
+        chunk = f.read(max(b - a, 0))
+    return parse_m30_csv(io.BytesIO(header + chunk), columns)
+
+
+def slice_columns(cols, start=None, end=None):
+    # 已加载列按时间区间 [start, end]（含端点）切片，返回零拷贝视图
+    t = cols["time"]
+    a = 0 if start is None else int(np.searchsorted(t, pd.Timestamp(start).value, side="left"))
+    b = len(t) if end is None else int(np.searchsorted(t, pd.Timestamp(end).value, side="right"))
+    return {k: v[a:b] for k, v in cols.items()}
+
+
+# =========================================================
+# 尾部增量摄入
+# =========================================================
+def _complete_end(f, size):
+    # 最后一个换行符之后的内容视为尚未写完的半行，不计入已摄入区间
+    pos = size
+    while pos > 0:
+        a = max(pos - 4096, 0)
+        f.seek(a)
+        k = f.read(pos - a).rfind(b"\n")
+        if k >= 0:
+            return a + k + 1
+        pos = a
+    return 0
+
+
+def _full_row(fragment, header):
+    # 末尾无换行的片段：字段数与表头一致且均非空时视为完整的一行
+    fields = fragment.rstrip(b"\r").split(b"\t")
+    return len(fields) == header.rstrip(b"\r\n").count(b"\t") + 1 and all(fields)
+
+
+def _ingest_end(f, size, header, whole):
+    # whole=True 把文件视为完整快照（缓存 / 存储），末尾无换行但字段齐全的行照常解析；
+    # whole=False 跟踪正在写入的文件，最后一个换行符之后的内容一律留给之后的摄入
+    end = _complete_end(f, size)
+    if whole and end < size:
+        f.seek(end)
+        if _full_row(f.read(size - end), header):
+            return size
+    return end
+
+
+def _hash_range(f, a, b, h):
+    f.seek(a)
+    while a < b:
+        block = f.read(min(HASH_BLOCK, b - a))
+        if not block:
+            break
+        h.update(block)
+        a += len(block)
+    return h
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def read_m30_complete(csv_path, columns=None):
+    # 整表解析（末尾无换行但字段齐全的行也计入），
+    # 返回 (列, 已摄入字节偏移, 已摄入前缀的哈希)；之后的尾部摄入从该偏移继续
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        data_start = f.tell()
+        offset = max(_ingest_end(f, os.fstat(f.fileno()).st_size, header, True), data_start)
+        f.seek(data_start)
+        chunk = f.read(offset - data_start)
+    h = _new_hash()
+    h.update(header + chunk)
+    return parse_m30_csv(io.BytesIO(header + chunk), columns), offset, h.digest()
+
+
+def read_m30_tail(csv_path, offset, marker, last_time=None, columns=None, stamp=None, whole=False):
+    # 只解析 offset 之后新追加的行，并丢弃时间 <= last_time 的重复行
+    # stamp 为上次摄入时的源文件戳 [mtime_ns, size]：未变化时不读文件内容；
+    # 大小仍等于 offset 但 mtime 变化视为原样大小的改写
+    # 文件被截断或改写（前缀哈希不一致、上次摄入的末行被续写）时返回 None，调用方应整表重建
+    with open(csv_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        if size < offset:
+            return None
+        if stamp is not None and size == offset and st.st_mtime_ns != int(stamp[0]):
+            return None
+        f.seek(0)
+        header = f.readline()
+        unchanged = size == offset or (stamp is not None and [st.st_mtime_ns, size] == [int(x) for x in stamp])
+        if unchanged:
+            end, new_marker = offset, marker
+        else:
+            h = _hash_range(f, 0, offset, _new_hash())
+            if h.digest() != marker:
+                return None
+            if offset > len(header):
+                # 上次摄入的末行没有换行符：新内容必须从换行开始
+                f.seek(offset - 1)
+                joint = f.read(2)
+                if joint[:1] != b"\n" and joint[1:] not in (b"\r", b"\n"):
+                    return None
+            end = max(_ingest_end(f, size, header, whole), offset)
+            new_marker = _hash_range(f, offset, end, h).digest()
+        f.seek(offset)
+        chunk = f.read(end - offset)
+
+    cols = parse_m30_csv(io.BytesIO(header + chunk), columns)
+    if last_time is not None:
+        keep = cols["time"] > last_time
+        if not keep.all():
+            cols = {k: v[keep] for k, v in cols.items()}
+    return cols, end, new_marker
+
+
+# =========================================================
+# 缓存读写
+# =========================================================
+def _map_member(path, zf, name):
+    # 未压缩的 npz 成员在文件中连续存放：跳过 zip 本地文件头和 .npy 头后只读内存映射
+    info = zf.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local = f.read(30)
+        name_len, extra_len = struct.unpack("<HH", local[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if fortran or dtype.hasobject or len(shape) != 1:
+        return None
+    if shape[0] == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def _read_cache(path, stamp, columns=None):
+    # 返回所需列的只读内存映射；调用方按时间切片后只有区间内的行会被读入
+    try:
+        with np.load(path) as npz:
+            if not np.array_equal(npz["source_stamp"], stamp):
+                return None
+        cols = {}
+        with zipfile.ZipFile(path) as zf:
+            for k in ["time"] + _column_names(columns):
+                cols[k] = _map_member(path, zf, k)
+                if cols[k] is None:
+                    # 旧格式（压缩）缓存：整列读取
+                    with np.load(path) as npz:
+                        cols[k] = npz[k]
+        return cols
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _read_cache_state(path):
+    # 忽略源文件戳，读出全部列、摄入位置及写入时的源文件戳（用于尾部追加）
+    try:
+        with np.load(path) as npz:
+            cols = {k: npz[k] for k in ["time"] + _column_names(None)}
+            return cols, int(npz["ingest_offset"]), npz["ingest_marker"].tobytes(), npz["source_stamp"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(path, cols, stamp, offset, marker):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, source_stamp=stamp, ingest_offset=np.int64(offset),
+                 ingest_marker=np.frombuffer(marker, dtype=np.uint8), **cols)
+    os.replace(tmp, path)
+
+
+def _ingest(csv_path, path, stamp):
+    # 缓存失效时：优先只解析新增尾部并追加，否则整表解析
+    state = _read_cache_state(path)
+    if state is not None:
+        old, offset, marker, old_stamp = state
+        last_time = old["time"][-1] if len(old["time"]) else None
+        tail = read_m30_tail(csv_path, offset, marker, last_time, stamp=old_stamp, whole=True)
+        if tail is not None:
+            new, offset, marker = tail
+            cols = {k: np.concatenate([old[k], new[k]]) for k in old}
+            return cols, offset, marker
+
+    return read_m30_complete(csv_path)
+
+
+def load_m30_ingested(csv_path):
+    # 经缓存返回 (全部列, 已摄入字节偏移, 校验字节)，供下游增量存储继续追加
+    stamp = source_stamp(csv_path)
+    path = cache_path(csv_path)
+    state = _read_cache_state(path)
+    if state is not None and _read_cache(path, stamp, ()) is not None:
+        return state[:3]
+    cols, offset, marker = _ingest(csv_path, path, stamp)
+    try:
+        _write_cache(path, cols, stamp, offset, marker)
+    except OSError:
+        pass
+    return cols, offset, marker
+
+
+def load_m30_columns(csv_path, start=None, end=None, columns=None, use_cache=True):
+    # start / end 为含端点的时间界限（Timestamp / datetime）
+    #   use_cache=True  读列式缓存并按时间二分切片；缓存失效时追加新增尾部或整表重建
+    #   use_cache=False 直接按文件偏移下推，只解析区间内的行
+    if not use_cache:
+        return read_m30_range(csv_path, start, end, columns)
+
+    stamp = source_stamp(csv_path)
+    path = cache_path(csv_path)
+    cols = _read_cache(path, stamp, columns)
+    if cols is None:
+        full, offset, marker = _ingest(csv_path, path, stamp)
+        try:
+            _write_cache(path, full, stamp, offset, marker)
+        except OSError:
+            # 数据目录只读时退化为不缓存
+            pass
+        cols = {k: full[k] for k in ["time"] + _column_names(columns)}
+    return slice_columns(cols, start, end)
+
+
+def m30_frame(cols):
+    index = pd.DatetimeIndex(cols["time"].view("datetime64[ns]"), name="datetime")
+    return pd.DataFrame({k: v for k, v in cols.items() if k != "time"}, index=index)
+
+
+def load_m30_frame(csv_path, start=None, end=None, columns=None, use_cache=True):
+    return m30_frame(load_m30_columns(csv_path, start, end, columns, use_cache))
+
+
+def cache_matches_source(csv_path, columns=None):
+    # 缓存路径与直接解析 CSV 的结果逐行比较（修改缓存 / 摄入逻辑后核对用）
+    cached = load_m30_columns(csv_path, columns=columns)
+    direct = read_m30_range(csv_path, columns=columns)
+    return all(np.array_equal(cached[k], direct[k]) for k in direct)
+
+
+if __name__ == "__main__":
+    import sys
+
+    status = 0
+    for csv_path in sys.argv[1:]:
+        ok = cache_matches_source(csv_path)
+        print(f"{csv_path}: {'ok' if ok else 'MISMATCH'}")
+        status |= not ok
+    sys.exit(status)
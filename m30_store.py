@@ -0,0 +1,170 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from m30_data import load_m30_ingested, read_m30_tail, PRICE_COLUMNS, COUNT_COLUMNS, source_stamp
+from wf_kernel import ema_extend
+
+# =========================================================
+# 内存映射 OHLCV 存储（多进程零拷贝共享）
+# =========================================================
+# 每个品种一个文件 <store_dir>/<SYMBOL>.m30：
+#   前 HEADER_SIZE 字节为 JSON 头（行数 / 容量、各列 dtype / 偏移、源文件戳及已摄入偏移）
+#   之后为按列连续存放的数据块（time int64 ns、OHLC float64、量 int64、ema_<span> float64），
+#   每列预留追加空间，CSV 末尾新增的 bar 原地写入，EMA 从最后状态增量递推
+# 各进程 attach 后得到只读 np.memmap，操作系统页缓存只保留一份数据
+# 注意：ema_<span> 为整段历史上计算的 EMA（ewm adjust=False），
+# 与脚本中从 START_DATE 开始计算的 EMA 在起始段会有差异
+DEFAULT_STORE_DIR = ".m30_store"
+HEADER_SIZE = 4096
+ALIGN = 64
+GROWTH_ROWS = 4096
+
+_ATTACHED = {}
+
+
+def store_path(symbol, store_dir=DEFAULT_STORE_DIR):
+    return os.path.join(store_dir, f"{symbol}.m30")
+
+
+def ema_column(span):
+    return f"ema_{span}"
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        return json.loads(f.read(HEADER_SIZE).rstrip(b"\0 "))
+
+
+def _write_store(path, header, cols):
+    # 每列预留 GROWTH_ROWS 行追加空间，尾部新 bar 可原地写入
+    rows = len(cols["time"])
+    capacity = rows + max(GROWTH_ROWS, rows // 4)
+    layout = {}
+    offset = HEADER_SIZE
+    for name in ["time"] + PRICE_COLUMNS + COUNT_COLUMNS + [ema_column(s) for s in header["ema_spans"]]:
+        dtype = np.dtype(cols[name].dtype)
+        layout[name] = [dtype.str, offset]
+        offset += -(-capacity * dtype.itemsize // ALIGN) * ALIGN
+    header.update(rows=rows, capacity=capacity, columns=layout)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_pack_header(header))
+        for name, (_, off) in layout.items():
+            f.seek(off)
+            f.write(np.ascontiguousarray(cols[name]).tobytes())
+        f.truncate(offset)
+    os.replace(tmp, path)
+    _ATTACHED.pop(os.path.abspath(path), None)
+
+
+def _pack_header(header):
+    raw = json.dumps(header).encode()
+    if len(raw) > HEADER_SIZE:
+        raise ValueError(f"store header too large for {header['symbol']}")
+    return raw.ljust(HEADER_SIZE, b" ")
+
+
+def _source_info(csv_path, offset, marker):
+    return {
+        "source": os.path.abspath(csv_path),
+        "source_stamp": source_stamp(csv_path).tolist(),
+        "source_offset": int(offset),
+        "source_marker": marker.hex(),
+    }
+
+
+def build_store(symbol, csv_path, ema_spans=(), store_dir=DEFAULT_STORE_DIR):
+    cols, offset, marker = load_m30_ingested(csv_path)
+    cols = dict(cols)
+    close = pd.Series(cols["close"])
+    for span in ema_spans:
+        cols[ema_column(span)] = close.ewm(span=span, adjust=False).mean().to_numpy()
+
+    header = {"symbol": symbol, "ema_spans": list(ema_spans), **_source_info(csv_path, offset, marker)}
+    os.makedirs(store_dir, exist_ok=True)
+    path = store_path(symbol, store_dir)
+    _write_store(path, header, cols)
+    return path
+
+
+def append_store(path, csv_path):
+    # 只解析 CSV 新追加的尾部行，EMA 从最后一个值继续递推；返回新增行数
+    # 源文件被改写（无法按追加处理）时返回 None
+    header = _read_header(path)
+    rows = header["rows"]
+    old = _map_columns(path, header)
+    last_time = int(old["time"][-1]) if rows else None
+    tail = read_m30_tail(csv_path, header["source_offset"], bytes.fromhex(header["source_marker"]), last_time,
+                         stamp=header["source_stamp"], whole=True)
+    if tail is None:
+        return None
+
+    new, offset, marker = tail
+    for span in header["ema_spans"]:
+        prev = float(old[ema_column(span)][-1]) if rows else None
+        new[ema_column(span)] = ema_extend(prev, new["close"], span)
+    header.update(_source_info(csv_path, offset, marker))
+    added = len(new["time"])
+
+    if rows + added > header["capacity"]:
+        # 预留空间不足：已有列 + 新行重写文件（仍不重新解析 CSV）
+        cols = {name: np.concatenate([np.asarray(old[name]), new[name]]) for name in header["columns"]}
+        del old
+        _write_store(path, header, cols)
+        return added
+
+    del old
+    with open(path, "r+b") as f:
+        for name, (dtype, off) in header["columns"].items():
+            f.seek(off + rows * np.dtype(dtype).itemsize)
+            f.write(np.ascontiguousarray(new[name], dtype=dtype).tobytes())
+        header["rows"] = rows + added
+        f.seek(0)
+        f.write(_pack_header(header))
+    _ATTACHED.pop(os.path.abspath(path), None)
+    return added
+
+
+def ensure_store(symbol, csv_path, ema_spans=(), store_dir=DEFAULT_STORE_DIR):
+    # 源 CSV 只在末尾追加时增量摄入；被改写或缺少所需 EMA 列时重建
+    path = store_path(symbol, store_dir)
+    if os.path.exists(path):
+        header = _read_header(path)
+        if set(ema_spans) <= set(header["ema_spans"]):
+            if header["source_stamp"] == source_stamp(csv_path).tolist():
+                return path
+            if append_store(path, csv_path) is not None:
+                return path
+        ema_spans = sorted(set(ema_spans) | set(header["ema_spans"]))
+    return build_store(symbol, csv_path, ema_spans, store_dir)
+
+
+def _map_columns(path, header):
+    n = header["rows"]
+    return {
+        name: np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=off, shape=(n,))
+        for name, (dtype, off) in header["columns"].items()
+    }
+
+
+def attach(symbol, store_dir=DEFAULT_STORE_DIR):
+    # 返回 {列名: 只读 memmap}；同一进程内重复 attach 复用同一映射
+    path = os.path.abspath(store_path(symbol, store_dir))
+    cols = _ATTACHED.get(path)
+    if cols is not None:
+        return cols
+
+    cols = _map_columns(path, _read_header(path))
+    _ATTACHED[path] = cols
+    return cols
+
+
+def store_frame(cols, start=0, end=None):
+    # 零拷贝 DataFrame 视图（行区间 [start, end)）
+    index = pd.DatetimeIndex(np.asarray(cols["time"][start:end]).view("datetime64[ns]"), name="datetime")
+    return pd.DataFrame({k: np.asarray(v[start:end]) for k, v in cols.items() if k != "time"},
+                        index=index, copy=False)
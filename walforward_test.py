@@ -1,8 +1,17 @@
-import pandas as pd
 import numpy as np
+import argparse
 import json
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
+
+from grid_cache import cached_grid_pnls
+from m30_data import load_m30_frame, label_bounds, PRICE_COLUMNS
+from wf_checkpoint import save_snapshot, load_snapshot
+from wf_instrument import InstrumentSpec
+from wf_kernel import extract_arrays, signal_array, run_pnl, run_pnl_grid, median_resolved
+from wf_optimize import halving_search, report_cache, report_halving, report_pruning
+from wf_schedule import build_rebalance_schedule, run_grid_searches, run_sliding_searches
+from wf_slide import SlidingGrid, report_sliding
+from wf_sweep import run_sweep
 
 # =========================================================
 # 全局参数
@@ -15,6 +24,7 @@ END_DATE   = "2026-01-01"
 
 INITIAL_CASH = 100000
 INITIAL_SHARES = 100
+SPEC = InstrumentSpec()  # 股票：cash_base 以价格计，size 为股数
 
 FAST_EMA = 9
 SLOW_EMA = 21
@@ -23,20 +33,52 @@ MARTINGALE_MULT = 2
 INITIAL_CASH_BASE = 1.5
 
 LOOKBACK_MONTHS = 3
+# 重优化间隔（月）；None = 与 LOOKBACK_MONTHS 相同（窗口互不重叠），1 = 每月用过去 LOOKBACK_MONTHS 个月重优化
+REBALANCE_MONTHS = None
 GRID_RANGE = np.arange(0.1, 6.01, 0.5)
 
+# 并行预计算全部回望网格搜索的进程数（None = 全部 CPU 核心，1 = 串行）
+GRID_WORKERS = None
+
+# 回望网格结果持久化缓存（None = 不使用缓存）
+GRID_CACHE_FILE = "grid_cache.sqlite"
+
+# main_backtest 运行状态（每次重优化前及运行结束时保存）：
+#   python <脚本> --resume  中断后从最近快照继续
+#   python <脚本> --extend  数据追加新 bar 后（END_DATE 相应后移），从上次运行的最终状态继续
+CHECKPOINT_FILE = "{symbol}_WalkForward.ckpt"
+
+# 回望参数优化方式："grid" = 穷举 GRID_RANGE；"halving" = 逐轮减半 + 细化（见 wf_optimize）
+GRID_OPTIMIZER = "grid"
+HALVING_RANGE = np.arange(0.1, 6.01, 0.1)
+HALVING_ETA = 2            # 每轮保留前 1/ETA，子窗口长度 ×ETA
+HALVING_MIN_BARS = 200     # 最短子窗口
+HALVING_KEEP = 4           # 完整窗口上保留的候选数（供中位选择规则使用）
+HALVING_BUDGET = None      # 完整窗口等价评估次数上限（None = 不限）
+HALVING_REFINE_STEP = 0.02  # 最优值附近的细化步长（None = 不细化）
+
+# 回望网格剪枝：已实现资金回撤超过 GRID_MAX_DRAWDOWN 的候选直接淘汰（None = 不限）；
+# GRID_RANK_PRUNE = True 时，淘汰的候选一旦足以确定选择结果，其余候选不再模拟（不改变选择结果）
+GRID_MAX_DRAWDOWN = None
+GRID_RANK_PRUNE = True
+
+# 回望窗口重叠（REBALANCE_MONTHS < LOOKBACK_MONTHS）时按时间顺序增量评估，
+# 重叠部分复用已模拟的交易路径（见 wf_slide）；只用于 "grid" 优化方式，选择结果与逐窗口搜索相同
+# 窗口互不重叠时没有可复用的部分，仍逐窗口搜索（排名剪枝更快）
+GRID_SLIDING = True
+
+# 多维参数扫描（parameter_sweep）取值，cash_base 维度沿用 GRID_RANGE
+SWEEP_FAST_EMA = [5, 7, 9, 12, 15]
+SWEEP_SLOW_EMA = [18, 21, 26, 34, 50]
+SWEEP_MULT = [1.5, 2, 2.5, 3]
+
 # =========================================================
 # 数据加载
 # =========================================================
 def load_data(path, start, end):
-    df = pd.read_csv(path, sep="\t")
-    df["datetime"] = pd.to_datetime(df["<DATE>"] + " " + df["<TIME>"])
-    df.set_index("datetime", inplace=True)
-    df = df.rename(columns={
-        "<OPEN>":"open","<HIGH>":"high",
-        "<LOW>":"low","<CLOSE>":"close"
-    })
-    df = df.loc[start:end]
+    # 列式二进制缓存 + 日期区间下推（见 m30_data），只取 OHLC 列
+    start_ts, end_ts = label_bounds(start, end)
+    df = load_m30_frame(path, start_ts, end_ts, columns=PRICE_COLUMNS)
     df["ema_fast"] = df["close"].ewm(span=FAST_EMA, adjust=False).mean()
     df["ema_slow"] = df["close"].ewm(span=SLOW_EMA, adjust=False).mean()
     return df
@@ -44,53 +86,129 @@ def load_data(path, start, end):
 # =========================================================
 # 单参数完整回测（给 Grid 用）
 # =========================================================
-def run_single_backtest(df, cash_base):
-    cash = INITIAL_CASH
-    shares = INITIAL_SHARES
-    pos = None
-    entry_price = None
-
-    for _, row in df.iterrows():
-        price = row.close
-
-        if pos:
-            pnl = (price - entry_price) * shares if pos == "LONG" else (entry_price - price) * shares
-            threshold = cash_base * shares
-
-            if abs(pnl) >= threshold:
-                cash += pnl
-                if pnl > 0:
-                    shares = INITIAL_SHARES
-                else:
-                    shares *= MARTINGALE_MULT
-                pos = None
+def kernel_params():
+    return dict(initial_size=INITIAL_SHARES, mult=MARTINGALE_MULT, spec=SPEC)
 
-        if not pos:
-            if row.ema_fast > row.ema_slow:
-                pos = "LONG"
-                entry_price = price
-            elif row.ema_fast < row.ema_slow:
-                pos = "SHORT"
-                entry_price = price
+KERNEL_PARAMS = kernel_params()
 
-    return cash - INITIAL_CASH
+def run_single_backtest(df, cash_base):
+    close, ema_fast, ema_slow = extract_arrays(df)
+    return run_pnl(close, signal_array(ema_fast, ema_slow), cash_base, INITIAL_CASH, **KERNEL_PARAMS)
 
 # =========================================================
 # 回望网格搜索（过去 n 个月）
 # =========================================================
-def grid_search(df):
-    results = []
-    for cb in GRID_RANGE:
-        pnl = run_single_backtest(df, cb)
-        results.append((cb, pnl))
+def grid_cache_params():
+    # 缓存键中的策略常量，任一改变都不会命中旧结果
+    return dict(initial_cash=INITIAL_CASH, fast_ema=FAST_EMA, slow_ema=SLOW_EMA, **KERNEL_PARAMS,
+                max_drawdown=GRID_MAX_DRAWDOWN)
 
-    results.sort(key=lambda x: x[1])
+def grid_search(df):
+    close, ema_fast, ema_slow = extract_arrays(df)
+    return grid_search_arrays(close, signal_array(ema_fast, ema_slow))
+
+def grid_search_arrays(close, signal):
+    return grid_search_detail(close, signal)[0]
+
+def grid_search_detail(close, signal):
+    # 返回 (cash_base, 统计)：prune 为剪枝统计，cache 为结果缓存命中统计，halving 为逐轮减半统计（仅 halving 模式）
+    prune = {}
+    cache = {}
+
+    def evaluate(cash_bases, start=0, resolved=None):
+        c, s = close[start:], signal[start:]
+        # 按选择规则剪枝后的结果依赖整组候选：缓存键带上候选集合，不命中时整组重算
+        params = dict(grid_cache_params(), rank_prune=None if resolved is None else [float(cb) for cb in cash_bases])
+        return cached_grid_pnls(
+            GRID_CACHE_FILE, c, s, cash_bases, params,
+            lambda missing: run_pnl_grid(c, s, missing, INITIAL_CASH, **KERNEL_PARAMS,
+                                         max_drawdown=GRID_MAX_DRAWDOWN, resolved=resolved, stats=prune),
+            partial=resolved is None, stats=cache)
+
+    stats = {"prune": prune, "cache": cache}
+    if GRID_OPTIMIZER == "halving":
+        results, stats["halving"] = halving_search(evaluate, HALVING_RANGE, len(close), HALVING_ETA, HALVING_MIN_BARS,
+                                                   HALVING_KEEP, HALVING_BUDGET, HALVING_REFINE_STEP)
+    else:
+        results = list(zip(GRID_RANGE, evaluate(GRID_RANGE, resolved=median_resolved if GRID_RANK_PRUNE else None)))
+
+    return select_cash_base(results), stats
+
+def select_cash_base(results):
+    # results 为 [(cash_base, pnl), ...]：按盈亏排序取中位
+    results = sorted(results, key=lambda x: x[1])
     return results[len(results)//2][0]
 
+def sliding_grid_details(close, signal, windows):
+    # 按时间顺序评估同一段行情上的多个回望窗口 [(start, end), ...]（见 wf_slide），
+    # 返回与 windows 对应的 (cash_base, 统计)；选择结果与逐窗口 grid_search_detail 相同
+    grid = SlidingGrid(close, signal, GRID_RANGE, INITIAL_CASH, **KERNEL_PARAMS, max_drawdown=GRID_MAX_DRAWDOWN)
+    # 完整（未做排名剪枝）的结果，与 GRID_RANK_PRUNE = False 时共用缓存
+    params = dict(grid_cache_params(), rank_prune=None)
+    details = []
+    for start, end in windows:
+        slide = {}
+        cache = {}
+        pnls = cached_grid_pnls(GRID_CACHE_FILE, close[start:end], signal[start:end], GRID_RANGE, params,
+                                lambda missing: grid.evaluate(start, end, missing, stats=slide), stats=cache)
+        details.append((select_cash_base(list(zip(GRID_RANGE, pnls))), {"sliding": slide, "cache": cache}))
+    return details
+
+# =========================================================
+# 多维参数扫描（FAST_EMA × SLOW_EMA × MARTINGALE_MULT × cash_base）
+# =========================================================
+def parameter_sweep(df):
+    # 返回带坐标的 N 维结果（见 wf_sweep），可用 sweep_frame 展开后画热力图
+    kernel = {k: v for k, v in KERNEL_PARAMS.items() if k not in ("initial_size", "mult")}
+    return run_sweep(df["close"], SWEEP_FAST_EMA, SWEEP_SLOW_EMA, SWEEP_MULT, GRID_RANGE,
+                     INITIAL_CASH, INITIAL_SHARES, **kernel)
+
 # =========================================================
 # 主 Walk-Forward 回测（增加资金校验，不删减功能）
 # =========================================================
-def main_backtest(df):
+def precompute_grid_choices(df, max_workers=GRID_WORKERS, start_bar=0):
+    # start_bar > 0 时只计算该 bar 及之后的重优化（续跑 / 增量延伸）
+    close, ema_fast, ema_slow = extract_arrays(df)
+    signal = signal_array(ema_fast, ema_slow)
+    schedule = [p for p in build_rebalance_schedule(df.index, START_DATE, LOOKBACK_MONTHS, REBALANCE_MONTHS) if p[0] >= start_bar]
+    overlap = REBALANCE_MONTHS is not None and REBALANCE_MONTHS < LOOKBACK_MONTHS
+    if GRID_SLIDING and overlap and GRID_OPTIMIZER == "grid":
+        details = run_sliding_searches(sliding_grid_details, close, signal, schedule, max_workers)
+        report_sliding([stats["sliding"] for _, stats in details])
+        report_cache([stats["cache"] for _, stats in details])
+        return [choice for choice, _ in details]
+    details = run_grid_searches(grid_search_detail, close, signal, schedule, max_workers)
+    if GRID_OPTIMIZER == "halving":
+        report_halving([stats["halving"] for _, stats in details])
+    if GRID_MAX_DRAWDOWN is not None or GRID_RANK_PRUNE:
+        report_pruning([stats["prune"] for _, stats in details])
+    report_cache([stats["cache"] for _, stats in details])
+    return [choice for choice, _ in details]
+
+def checkpoint_params():
+    # 快照 key 中的参数：任一改变时不从旧快照续跑
+    return dict(grid_cache_params(), start_date=START_DATE, lookback_months=LOOKBACK_MONTHS,
+                rebalance_months=REBALANCE_MONTHS, initial_cash_base=INITIAL_CASH_BASE, grid_optimizer=GRID_OPTIMIZER,
+                grid_range=[float(cb) for cb in GRID_RANGE], grid_rank_prune=GRID_RANK_PRUNE,
+                halving=[[float(cb) for cb in HALVING_RANGE], HALVING_ETA, HALVING_MIN_BARS,
+                         HALVING_KEEP, HALVING_BUDGET, HALVING_REFINE_STEP])
+
+def load_run_snapshot(df, path):
+    close, ema_fast, ema_slow = extract_arrays(df)
+    return load_snapshot(path, close, signal_array(ema_fast, ema_slow), checkpoint_params())
+
+def resume_grid_choices(df, snapshot, max_workers=GRID_WORKERS):
+    # 快照中剩余的预计算结果 + 之后新增数据上的重优化（只计算未覆盖的窗口）
+    saved = snapshot["grid_choices"] or []
+    pending = [p for p in build_rebalance_schedule(df.index, START_DATE, LOOKBACK_MONTHS, REBALANCE_MONTHS) if p[0] >= snapshot["bar"]]
+    if len(pending) <= len(saved):
+        return saved
+    return saved + precompute_grid_choices(df, max_workers, start_bar=pending[len(saved)][0])
+
+def main_backtest(df, grid_choices=None, checkpoint=None, resume=None):
+    # checkpoint 为快照文件路径：每个重优化 bar 处理前及运行结束时保存完整状态（含剩余的 grid_choices）
+    # resume 为 load_run_snapshot 返回的快照：从快照 bar 继续，结果与不间断运行逐字节一致
+    # grid_choices 用完后（快照之后新增的重优化）在线计算
     cash = INITIAL_CASH
     shares = INITIAL_SHARES
     pos = None
@@ -102,18 +220,49 @@ def main_backtest(df):
     trades = []
     equity_curve = []
 
-    last_grid_time = pd.to_datetime(START_DATE)
+    close, ema_fast, ema_slow = extract_arrays(df)
+    signal = signal_array(ema_fast, ema_slow)
+    times = df.index
+
+    start = 0
+    if resume is not None:
+        start = resume["bar"]
+        cash, shares, pos = resume["cash"], resume["size"], resume["pos"]
+        entry_price, entry_time = resume["entry_price"], resume["entry_time"]
+        martingale_level = resume["martingale_level"]
+        current_cash_base = resume["cash_base"]
+        trades, equity_curve = list(resume["trades"]), list(resume["equity_curve"])
+        if grid_choices is None:
+            grid_choices = resume["grid_choices"]
+    params = checkpoint_params() if checkpoint is not None else None
+
+    # 预先规划所有重优化 bar 及其回望窗口 [start, end)
+    # grid_choices 为 precompute_grid_choices 的结果时直接按顺序回放（续跑时只含快照 bar 之后的部分）
+    plan = iter([p for p in build_rebalance_schedule(times, START_DATE, LOOKBACK_MONTHS, REBALANCE_MONTHS) if p[0] >= start])
+    next_grid_bar, win_start, win_end = next(plan, (-1, 0, 0))
+    choices = list(grid_choices) if grid_choices is not None else None
+    used = 0
+
+    def snapshot(bar):
+        save_snapshot(checkpoint, close, signal, params, dict(
+            bar=bar, cash=cash, size=shares, pos=pos, entry_price=entry_price, entry_time=entry_time,
+            martingale_level=martingale_level, cash_base=current_cash_base, trades=trades,
+            equity_curve=equity_curve, grid_choices=None if choices is None else choices[used:]))
+
+    for i, (price, sig) in enumerate(zip(close[start:].tolist(), signal[start:].tolist()), start):
+        if params is not None and i == next_grid_bar and i > start:
+            snapshot(i)
 
-    for time, row in df.iterrows():
-        price = row.close
         equity_curve.append(round(cash, 2))
 
         # === 是否触发回望参数更新 ===
-        if time >= last_grid_time + relativedelta(months=LOOKBACK_MONTHS):
-            lookback_start = time - relativedelta(months=LOOKBACK_MONTHS)
-            lookback_df = df.loc[lookback_start:time]
-            current_cash_base = grid_search(lookback_df)
-            last_grid_time = time
+        if i == next_grid_bar:
+            if choices is None or used == len(choices):
+                current_cash_base = grid_search_arrays(close[win_start:win_end], signal[win_start:win_end])
+            else:
+                current_cash_base = choices[used]
+                used += 1
+            next_grid_bar, win_start, win_end = next(plan, (-1, 0, 0))
 
         # === 平仓判断 ===
         if pos:
@@ -125,7 +274,7 @@ def main_backtest(df):
 
                 trades.append({
                     "Entry Time": entry_time,
-                    "Exit Time": time,
+                    "Exit Time": times[i],
                     "Direction": pos,
                     "Shares": shares,
                     "Martingale Level": martingale_level,
@@ -153,25 +302,27 @@ def main_backtest(df):
             required_cash = shares * price  # 保守保证金假设
 
             # === 多头 ===
-            if row.ema_fast > row.ema_slow:
+            if sig > 0:
                 if cash >= required_cash:
                     pos = "LONG"
                     entry_price = price
-                    entry_time = time
+                    entry_time = times[i]
                 else:
                     # 资金不足，跳过本次信号
                     pass
 
             # === 空头 ===
-            elif row.ema_fast < row.ema_slow:
+            elif sig < 0:
                 if cash >= required_cash:
                     pos = "SHORT"
                     entry_price = price
-                    entry_time = time
+                    entry_time = times[i]
                 else:
                     # 资金不足，跳过本次信号
                     pass
 
+    if params is not None:
+        snapshot(len(close))
     return trades, equity_curve
 
 # =========================================================
@@ -361,12 +512,47 @@ new Chart(document.getElementById("eq"), {{
 
     print(f"HTML report generated: {SYMBOL}_WalkForward_Report.html")
 
+# =========================================================
+# 流式实盘 / 模拟盘（见 wf_stream）
+# =========================================================
+def stream_config():
+    # 用法：StreamEngine(stream_config()).run(csv_bars(CSV_FILE, START_DATE), on_event=print)
+    return dict(initial_cash=INITIAL_CASH, initial_size=INITIAL_SHARES, mult=MARTINGALE_MULT,
+                fast_ema=FAST_EMA, slow_ema=SLOW_EMA, initial_cash_base=INITIAL_CASH_BASE, spec=SPEC,
+                lookback_months=LOOKBACK_MONTHS, rebalance_months=REBALANCE_MONTHS, start_date=START_DATE,
+                grid_fn=grid_search_arrays)
+
+# =========================================================
+# 参数覆盖（批量运行见 wf_batch）
+# =========================================================
+def configure(**overrides):
+    # 按名称覆盖全局参数，并重建派生的 KERNEL_PARAMS
+    global KERNEL_PARAMS
+    unknown = [k for k in overrides if k not in globals()]
+    if unknown:
+        raise KeyError(f"unknown parameters: {unknown}")
+    globals().update(overrides)
+    KERNEL_PARAMS = kernel_params()
+
 # =========================================================
 # 主入口
 # =========================================================
 def main():
+    parser = argparse.ArgumentParser(description=f"{SYMBOL} walk-forward backtest")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run from its last checkpoint")
+    parser.add_argument("--extend", action="store_true", help="continue a finished run over newly appended bars")
+    args = parser.parse_args()
+
     df = load_data(CSV_FILE, START_DATE, END_DATE)
-    trades, equity = main_backtest(df)
+    checkpoint = CHECKPOINT_FILE.format(symbol=SYMBOL)
+    # 两种方式相同：从保存的状态继续，只处理其后的 bar 和重优化
+    snapshot = load_run_snapshot(df, checkpoint) if args.resume or args.extend else None
+    if snapshot is None:
+        grid_choices = precompute_grid_choices(df)
+    else:
+        grid_choices = resume_grid_choices(df, snapshot)
+        print(f"Continuing from bar {snapshot['bar']} of {len(df)} ({len(snapshot['trades'])} trades so far)")
+    trades, equity = main_backtest(df, grid_choices, checkpoint=checkpoint, resume=snapshot)
     generate_html(trades, equity)
     print("Walk-Forward backtest completed")
 
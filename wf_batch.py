@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import importlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from m30_catalog import load_symbol_columns, load_symbol_frame
+from m30_data import label_bounds, PRICE_COLUMNS
+from wf_live import WATCHLIST
+
+# =========================================================
+# 多品种批量 Walk-Forward（任务清单 + 进程池 + 断点续跑）
+# =========================================================
+# 任务清单（JSON）：symbols × ranges × params 的笛卡尔积
+#   {"symbols": {"BOIL": "walforward_test", "EURUSD": "walforward_test_forxe"},
+#    "ranges": [["2024-01-01", "2025-01-01"], ["2025-01-01", null]],
+#    "params": [{}, {"MARTINGALE_MULT": 1.5}]}
+# symbols 的值为使用的脚本（决定股票 / 外汇规则），params 为该脚本的全局参数覆盖（见 configure）
+# ranges 的起点为 null 时从该品种第一根 bar 所在日开始，终点为 null 时到最后一根 bar
+# 按 bar 数从大到小提交到进程池；每个完成的任务写入 checkpoint 目录下 <job_id>.json，
+# 重新运行同一清单时跳过已完成的任务
+DEFAULT_MANIFEST = {
+    "symbols": WATCHLIST,
+    "ranges": [["2025-01-01", None]],
+    "params": [{}],
+}
+CHECKPOINT_DIR = "batch_runs"
+BATCH_WORKERS = None  # None = CPU 核数
+DATA_DIR = "."
+
+
+def expand_manifest(manifest):
+    jobs = []
+    for (symbol, script), (start, end), params in itertools.product(
+            manifest["symbols"].items(), manifest["ranges"], manifest.get("params", [{}])):
+        job = {"symbol": symbol, "script": script, "start": start, "end": end, "params": params}
+        job["job_id"] = job_id(job)
+        jobs.append(job)
+    return jobs
+
+
+def job_id(job):
+    # 由任务内容决定，清单顺序变化不影响续跑
+    key = {k: job[k] for k in ("symbol", "script", "start", "end", "params")}
+    return hashlib.blake2b(json.dumps(key, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def job_bars(job):
+    # 任务的 bar 数（只读时间列，用于大任务优先排序和吞吐统计）
+    cols = load_symbol_columns(job["symbol"], *label_bounds(job["start"], job["end"]), columns=[], data_dir=DATA_DIR)
+    return len(cols["time"])
+
+
+# =========================================================
+# 单个任务（进程池 worker 中执行）
+# =========================================================
+def run_job(job):
+    # 每个任务重新加载脚本模块，避免上一个任务的参数覆盖残留在 worker 中
+    module = importlib.reload(importlib.import_module(job["script"]))
+    module.configure(SYMBOL=job["symbol"], START_DATE=job["start"], END_DATE=job["end"],
+                     GRID_WORKERS=1, **job["params"])
+
+    t0 = time.perf_counter()
+    df = load_symbol_frame(job["symbol"], *label_bounds(job["start"], job["end"]),
+                           columns=PRICE_COLUMNS, data_dir=DATA_DIR)
+    if job["start"] is None and len(df):
+        # 重优化时间表以 START_DATE 为起点，不能为 None
+        module.configure(START_DATE=df.index[0].strftime("%Y-%m-%d"))
+    df["ema_fast"] = df["close"].ewm(span=module.FAST_EMA, adjust=False).mean()
+    df["ema_slow"] = df["close"].ewm(span=module.SLOW_EMA, adjust=False).mean()
+    # 脚本自身的剪枝 / 减半统计输出在批量运行中关闭，避免多个 worker 输出交错
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid_choices = module.precompute_grid_choices(df, max_workers=1)
+    trades, equity = module.main_backtest(df, grid_choices)
+
+    pnl = round(sum(t["PnL"] for t in trades), 2)
+    wins = sum(1 for t in trades if t["PnL"] > 0)
+    return {
+        **job,
+        "bars": len(df),
+        "trades": len(trades),
+        "win_rate": round(wins / len(trades) * 100, 2) if trades else 0.0,
+        "pnl": pnl,
+        "final_equity": equity[-1] if equity else module.INITIAL_CASH,
+        "max_level": max((t["Martingale Level"] for t in trades), default=0),
+        "seconds": round(time.perf_counter() - t0, 3),
+        "trade_log": trades,
+    }
+
+
+# =========================================================
+# 断点（每个任务一个 JSON 文件，先写临时文件再改名）
+# =========================================================
+def checkpoint_path(checkpoint_dir, jid):
+    return os.path.join(checkpoint_dir, f"{jid}.json")
+
+
+def save_checkpoint(checkpoint_dir, result):
+    path = checkpoint_path(checkpoint_dir, result["job_id"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(result, f, default=str)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(checkpoint_dir, jid):
+    path = checkpoint_path(checkpoint_dir, jid)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# =========================================================
+# 调度
+# =========================================================
+def run_batch(manifest, checkpoint_dir=CHECKPOINT_DIR, max_workers=BATCH_WORKERS):
+    # 返回全部任务（含之前已完成的）的结果列表，顺序同清单展开顺序
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    jobs = expand_manifest(manifest)
+    results = {}
+    pending = []
+    for job in jobs:
+        done = load_checkpoint(checkpoint_dir, job["job_id"])
+        if done is not None:
+            results[job["job_id"]] = done
+            continue
+        try:
+            job["est_bars"] = job_bars(job)
+        except FileNotFoundError as e:
+            print(f"skip {job['symbol']} {job['start']}..{job['end']}: {e}")
+            continue
+        pending.append(job)
+
+    # 大任务优先，避免最后只剩一个长任务单独运行
+    pending.sort(key=lambda j: j["est_bars"], reverse=True)
+    print(f"Batch: {len(jobs)} jobs, {len(results)} already done, {len(pending)} to run")
+
+    t0 = time.perf_counter()
+    bars = 0
+    failed = 0
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(max_workers, max(len(pending), 1))) as ex:
+        futures = {ex.submit(run_job, job): job for job in pending}
+        try:
+            for n, fut in enumerate(as_completed(futures), 1):
+                job = futures[fut]
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[{n}/{len(pending)}] {job['symbol']} {job['job_id']} failed: {e!r}")
+                    continue
+                save_checkpoint(checkpoint_dir, result)
+                results[job["job_id"]] = result
+                bars += result["bars"]
+                print(f"[{n}/{len(pending)}] {job['symbol']} {job['start']}..{job['end']} {job['params']} "
+                      f"bars {result['bars']} PnL {result['pnl']} ({result['seconds']}s)")
+        except KeyboardInterrupt:
+            # 已完成的任务都已写入断点，重新运行即可续跑
+            ex.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    elapsed = time.perf_counter() - t0
+    ran = len(pending) - failed
+    if ran:
+        print(f"Throughput: {ran / elapsed * 60:.1f} jobs/min, {bars / elapsed:,.0f} bars/sec "
+              f"({ran} jobs, {elapsed:.1f}s, {failed} failed)")
+    return [results[j["job_id"]] for j in jobs if j["job_id"] in results]
+
+
+def batch_summary(results):
+    columns = ["symbol", "script", "start", "end", "params", "bars", "trades", "win_rate", "pnl",
+               "final_equity", "max_level", "seconds", "job_id"]
+    df = pd.DataFrame([{k: r[k] for k in columns} for r in results], columns=columns)
+    df["params"] = df["params"].map(lambda p: json.dumps(p, sort_keys=True))
+    return df
+
+
+# =========================================================
+# 主入口
+# =========================================================
+def main():
+    parser = argparse.ArgumentParser(description="Batch walk-forward over a job manifest")
+    parser.add_argument("manifest", nargs="?", help="JSON manifest (default: watchlist from 2025-01-01)")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    args = parser.parse_args()
+
+    manifest = DEFAULT_MANIFEST
+    if args.manifest:
+        with open(args.manifest, encoding="utf-8") as f:
+            manifest = json.load(f)
+    results = run_batch(manifest, args.checkpoint_dir, args.workers)
+    summary = batch_summary(results)
+    summary.to_csv(os.path.join(args.checkpoint_dir, "batch_summary.csv"), index=False)
+    print(summary.drop(columns=["job_id"]).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import pickle
+
+from grid_cache import window_key
+
+# =========================================================
+# main_backtest 断点快照 / 运行状态持久化
+# =========================================================
+# 快照为某个 bar 开始处理前的完整状态：
+#   bar（从该 bar 继续）、cash、size、pos、entry_price、entry_time、martingale_level、
+#   current_cash_base、已完成交易、已记录净值（长度即 bar，续跑时从此偏移继续追加）、
+#   剩余的预计算 grid_choices
+# 每次重优化前保存一次（崩溃后 --resume），运行结束时保存最终状态（新数据到达后 --extend）
+# 用 pickle 保存，浮点数与 Timestamp 原样恢复，续跑结果与不间断运行逐字节一致
+# key 为快照 bar 之前的行情（close + 信号）与策略参数的哈希：
+#   信号只依赖过去的数据，文件末尾追加新 bar 不影响 key；历史数据或参数改变时旧快照不会被使用
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_key(close, signal, bar, params):
+    return window_key(close[:bar], signal[:bar], dict(params, snapshot_version=SNAPSHOT_VERSION))
+
+
+def save_snapshot(path, close, signal, params, state):
+    # 先写临时文件再改名，中途崩溃不会留下损坏的快照
+    key = snapshot_key(close, signal, state["bar"], params)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"key": key, **state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_snapshot(path, close, signal, params):
+    # 返回快照 dict；文件不存在或与当前行情 / 参数不匹配时返回 None
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    key = state.pop("key", None)
+    if state["bar"] > len(close) or key != snapshot_key(close, signal, state["bar"], params):
+        print(f"Checkpoint {path} was written for different data or parameters, starting over")
+        return None
+    return state
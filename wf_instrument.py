@@ -0,0 +1,56 @@
+from typing import NamedTuple
+
+# =========================================================
+# 品种规格：股票 / 外汇共用同一套内核
+# =========================================================
+# 盈亏 = 价差 × price_value × size；外汇原写法 价差 / POINT * POINT * CONTRACT_SIZE
+# 中的点值换算互相抵消，折叠为一个预先计算的乘数（price_value = contract_size）
+# cash_base 在股票中以价格计，外汇中以点计：价格距离 = cash_base × band_unit
+# 保证金 = price × price_value × size / leverage（股票 leverage = 1 即 size × price）
+
+
+class InstrumentSpec(NamedTuple):
+    point: float = None        # 最小报价单位；None = 股票（cash_base 以价格计）
+    contract_size: float = 1   # 每手合约数量；股票为 1（size 即股数）
+    leverage: float = 1        # 保证金杠杆
+    lot_step: float = None     # 马丁放大后的 size 取整到该步长（见 normalize_size）；None = 不取整
+    price_digits: int = 2      # 报价小数位（交易记录价格取整）
+
+    @property
+    def price_value(self):
+        # 价格变动 1.0、每单位 size 的盈亏
+        return self.contract_size
+
+    @property
+    def band_unit(self):
+        return 1 if self.point is None else self.point
+
+    @property
+    def size_field(self):
+        # 交易记录中 size 的列名
+        return "Shares" if self.point is None else "Lots"
+
+    def threshold_unit(self, cash_base):
+        # 平仓阈值（每单位 size 的盈亏金额）
+        return cash_base * self.band_unit * self.price_value
+
+    def margin(self, price, size):
+        return price * self.price_value * size / self.leverage
+
+    def normalize_size(self, size, prev=None):
+        # 放大后的 size 取最近的 lot_step 整数倍；prev 为放大前的 size，
+        # 放大时至少比 prev 多一个步长（非整数倍数如 1.5 下 0.01 手不会一直停在 0.01）
+        # 会改变非整数倍数时的马丁序列，因此默认不取整（lot_step = None）
+        if self.lot_step is None:
+            return size
+        steps = round(size / self.lot_step)
+        if prev is not None and size > prev:
+            steps = max(steps, round(prev / self.lot_step) + 1)
+        return steps * self.lot_step
+
+
+STOCK = InstrumentSpec()
+
+
+def forex_spec(point=0.00001, contract_size=100000, leverage=30, lot_step=None, price_digits=5):
+    return InstrumentSpec(point, contract_size, leverage, lot_step, price_digits)
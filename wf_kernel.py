@@ -0,0 +1,278 @@
+import numpy as np
+
+from wf_instrument import STOCK
+
+# =========================================================
+# 数组化回测内核（替代 df.iterrows() 逐行循环）
+# =========================================================
+LONG = 1
+SHORT = -1
+INSUFFICIENT_CASH = -1e9
+# 网格剪枝淘汰的候选与资金不足同样处理（同一取值，排序时并列在最前）
+PRUNED = INSUFFICIENT_CASH
+
+
+def extract_arrays(df):
+    close = df["close"].to_numpy(dtype=np.float64)
+    ema_fast = df["ema_fast"].to_numpy(dtype=np.float64)
+    ema_slow = df["ema_slow"].to_numpy(dtype=np.float64)
+    return close, ema_fast, ema_slow
+
+
+def signal_array(ema_fast, ema_slow):
+    # 1 = 多头信号, -1 = 空头信号, 0 = 均线相等（不开仓）
+    return np.where(ema_fast > ema_slow, LONG, np.where(ema_fast < ema_slow, SHORT, 0)).astype(np.int8)
+
+
+def run_pnl(close, signal, cash_base, initial_cash, initial_size, mult,
+            max_size=None, spec=STOCK, check_cash=False):
+    # 与各脚本 run_single_backtest 逐 bar 语义一致：
+    #   max_size      马丁最大 size（None 为不限制）
+    #   spec          品种规格（见 wf_instrument）：盈亏乘数 / 阈值单位 / 保证金 / 手数步长
+    #   check_cash    开仓前检查资金（保证金），不足时返回 INSUFFICIENT_CASH
+    # 股票运算顺序与原脚本逐项相同，保证浮点结果完全一致
+    if hasattr(close, "tolist"):
+        close = close.tolist()
+    if hasattr(signal, "tolist"):
+        signal = signal.tolist()
+
+    cash = initial_cash
+    size = initial_size
+    pos = 0
+    entry_price = 0.0
+    value = spec.price_value
+    leverage = spec.leverage
+    threshold_unit = spec.threshold_unit(cash_base)
+
+    for price, sig in zip(close, signal):
+        if pos:
+            diff = price - entry_price if pos == LONG else entry_price - price
+            pnl = diff * value * size
+
+            if abs(pnl) >= threshold_unit * size:
+                cash += pnl
+                if pnl > 0:
+                    size = initial_size
+                else:
+                    size = spec.normalize_size(size * mult, size)
+                    if max_size is not None and size > max_size:
+                        size = max_size
+                pos = 0
+
+        if not pos:
+            if check_cash and cash < price * value * size / leverage:
+                return INSUFFICIENT_CASH
+            if sig:
+                pos = sig
+                entry_price = price
+
+    return cash - initial_cash
+
+
+# =========================================================
+# 批量网格评估：所有 cash_base 在同一次 bar 扫描中推进
+# =========================================================
+def _exit_band(entry_price, distance):
+    # 保守的价格带：价格在带内时不可能触发平仓，可跳过精确计算
+    tol = 1e-9 * (distance + abs(entry_price))
+    return entry_price - distance + tol, entry_price + distance - tol
+
+
+def run_pnl_grid(close, signal, cash_bases, initial_cash, initial_size, mult,
+                 max_size=None, spec=STOCK, check_cash=False,
+                 max_drawdown=None, resolved=None, stats=None):
+    # 与逐个调用 run_pnl 结果完全一致，返回顺序与 cash_bases 相同
+    # mult 可为标量，或与 cash_bases 等长的序列（每个候选各自的马丁倍数）
+    # 剪枝（默认关闭）：
+    #   max_drawdown  已实现资金自峰值回撤超过该值的候选记为 PRUNED，不再模拟
+    #   resolved      resolved(dead, live, n) 为 True 时说明选择结果已确定（见 *_resolved），
+    #                 其余存活候选停止模拟并返回当前已实现盈亏（只保证选择结果不变）
+    #   stats         dict，累加 drawdown / rank 剪枝候选数和跳过的 bar 数（bars_skipped）
+    # 状态按候选参数保存为长度 len(cash_bases) 的向量；每个 bar 先用
+    # 全局价格带（所有持仓候选的最窄带）过滤，只有价格越出带外才逐个精确判断
+    if hasattr(close, "tolist"):
+        close = close.tolist()
+    if hasattr(signal, "tolist"):
+        signal = signal.tolist()
+
+    n = len(cash_bases)
+    cash_bases = [float(cb) for cb in cash_bases]
+    mults = list(mult) if np.ndim(mult) else [mult] * n
+    value = spec.price_value
+    leverage = spec.leverage
+    threshold_unit = [spec.threshold_unit(cb) for cb in cash_bases]
+    distance = [cb * spec.band_unit for cb in cash_bases]
+
+    cash = [initial_cash] * n
+    size = [initial_size] * n
+    pos = [0] * n
+    entry = [0.0] * n
+    lo = [0.0] * n
+    hi = [0.0] * n
+    peak = [initial_cash] * n
+    result = [None] * n
+    active = list(range(n))
+    dead = []
+    band_lo = band_hi = 0.0
+    any_flat = True
+    n_bars = len(close)
+    pruned_dd = pruned_rank = skipped = 0
+
+    for t, (price, sig) in enumerate(zip(close, signal)):
+        if not any_flat and band_lo < price < band_hi:
+            continue
+
+        changed = False
+        died = False
+        for i in active:
+            p = pos[i]
+            if p:
+                if lo[i] < price < hi[i]:
+                    continue
+                diff = price - entry[i] if p == LONG else entry[i] - price
+                s = size[i]
+                pnl = diff * value * s
+                if abs(pnl) < threshold_unit[i] * s:
+                    continue
+                cash[i] += pnl
+                if pnl > 0:
+                    size[i] = initial_size
+                else:
+                    s = spec.normalize_size(s * mults[i], s)
+                    if max_size is not None and s > max_size:
+                        s = max_size
+                    size[i] = s
+                pos[i] = 0
+
+                if max_drawdown is not None:
+                    if cash[i] > peak[i]:
+                        peak[i] = cash[i]
+                    elif peak[i] - cash[i] > max_drawdown:
+                        result[i] = PRUNED
+                        dead.append(i)
+                        changed = died = True
+                        pruned_dd += 1
+                        skipped += n_bars - t - 1
+                        continue
+
+            if check_cash and cash[i] < price * value * size[i] / leverage:
+                result[i] = INSUFFICIENT_CASH
+                dead.append(i)
+                changed = died = True
+                continue
+            changed = True
+            if sig:
+                pos[i] = sig
+                entry[i] = price
+                lo[i], hi[i] = _exit_band(price, distance[i])
+
+        if changed:
+            active = [i for i in active if result[i] is None]
+            if died and resolved is not None and active and resolved(dead, active, n):
+                for i in active:
+                    result[i] = cash[i] - initial_cash
+                pruned_rank += len(active)
+                skipped += len(active) * (n_bars - t - 1)
+                break
+            any_flat = False
+            band_lo, band_hi = float("-inf"), float("inf")
+            for i in active:
+                if not pos[i]:
+                    any_flat = True
+                    break
+                if lo[i] > band_lo:
+                    band_lo = lo[i]
+                if hi[i] < band_hi:
+                    band_hi = hi[i]
+            if not active:
+                break
+
+    for i in range(n):
+        if result[i] is None:
+            result[i] = cash[i] - initial_cash
+    if stats is not None:
+        stats["drawdown"] = stats.get("drawdown", 0) + pruned_dd
+        stats["rank"] = stats.get("rank", 0) + pruned_rank
+        stats["bars_skipped"] = stats.get("bars_skipped", 0) + skipped
+        stats["bars_total"] = stats.get("bars_total", 0) + n * n_bars
+    return result
+
+
+# =========================================================
+# 网格剪枝：选择结果是否已确定
+# =========================================================
+# 前提：候选按 cash_base 升序排列；被淘汰的候选取值相同（PRUNED），稳定排序后按原顺序
+# 排在最前；存活到最后的候选盈亏必大于 PRUNED。dead 为已淘汰候选（永久），live 为存活候选
+def median_resolved(dead, live, n):
+    # 规则：盈亏升序排序后取第 n // 2 个（walforward_test）
+    # 淘汰数已超过一半、且存活候选的位置都在该中位淘汰候选之后时，之后再淘汰也不会改变它的排名
+    mid = n // 2
+    if len(dead) <= mid:
+        return False
+    return min(live) > sorted(dead)[mid]
+
+
+def upper_half_resolved(dead, live, n):
+    # 规则：盈亏排名后一半中取 cash_base 最大者（walforward_test_V2 / forxe）
+    # 淘汰数超过一半时，最大 cash_base 的候选无论存活与否都在后一半中，结果必为它
+    return len(dead) > n // 2
+
+
+# =========================================================
+# 增量 EMA（与 pandas ewm(span=span, adjust=False).mean() 逐位一致）
+# =========================================================
+def ema_extend(prev, values, span):
+    # prev 为上一个 EMA 值（None 表示从 values[0] 开始），返回新增部分的 EMA
+    # 运算与 pandas 的 ewm 实现相同：(old * w + new * x) / (old + new)
+    alpha = 2.0 / (span + 1)
+    old_wt = 1.0 - alpha
+    values = values.tolist() if hasattr(values, "tolist") else list(values)
+    out = np.empty(len(values), dtype=np.float64)
+    w = prev
+    for i, x in enumerate(values):
+        if w is None:
+            w = x
+        elif w != x:
+            w = (old_wt * w + alpha * x) / (old_wt + alpha)
+        out[i] = w
+    return out
+
+
+# =========================================================
+# 跳跃式平仓查找（稀疏表区间最大 / 最小值）
+# =========================================================
+def build_range_table(close):
+    # mx[k][i] / mn[k][i] = close[i : i + 2**k] 的最大 / 最小值
+    # 只依赖收盘价，可在同一窗口的所有 GRID_RANGE 候选间复用
+    close = np.asarray(close, dtype=np.float64)
+    mx, mn = [close], [close]
+    step = 1
+    while 2 * step <= len(close):
+        mx.append(np.maximum(mx[-1][:-step], mx[-1][step:]))
+        mn.append(np.minimum(mn[-1][:-step], mn[-1][step:]))
+        step *= 2
+    return {
+        "n": len(close),
+        "close": close.tolist(),
+        "max": [a.tolist() for a in mx],
+        "min": [a.tolist() for a in mn],
+    }
+
+
+def find_exit(table, start, lo, hi):
+    # 返回 start 起第一个 close <= lo 或 close >= hi 的 bar 位置（不存在返回 n）
+    # 先按 1, 2, 4... 倍增跳跃，再逐级回退，耗时 O(log 距离)
+    n = table["n"]
+    mx, mn = table["max"], table["min"]
+    top = len(mx) - 1
+    pos = start
+    k = 0
+    while pos + (1 << k) <= n and mx[k][pos] < hi and mn[k][pos] > lo:
+        pos += 1 << k
+        if k < top:
+            k += 1
+    while k > 0:
+        k -= 1
+        if pos + (1 << k) <= n and mx[k][pos] < hi and mn[k][pos] > lo:
+            pos += 1 << k
+    return pos
@@ -0,0 +1,204 @@
+import asyncio
+import functools
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+from m30_catalog import get_catalog, find_files
+from wf_stream import StreamEngine, csv_updates, column_bars
+
+# =========================================================
+# 多品种实时调度（asyncio，单进程单事件循环）
+# =========================================================
+# 每个品种：行情协程（跟踪本地 CSV）-> 有界队列 -> 引擎协程（StreamEngine 逐 bar 推进）
+#   股票按股数、外汇按手数 × CONTRACT_SIZE / LEVERAGE 计算，配置来自对应脚本的 stream_config()
+#   回望网格重优化提交到共享进程池；需要等待结果的 bar 在线程中推进，不阻塞其他品种
+#   队列满时行情协程挂起、暂停读取文件（背压），引擎追上后继续
+WATCHLIST = {
+    "BOIL": "walforward_test_V2",
+    "TQQQ": "walforward_test_V2",
+    "SOXL": "walforward_test_V2",
+    "UGL": "walforward_test_V2",
+    "BITX": "walforward_test_V2",
+    "EURUSD": "walforward_test_forxe",
+    "GBPUSD": "walforward_test_forxe",
+}
+START_DATE = "2025-01-01"
+DATA_DIR = "."
+
+QUEUE_SIZE = 256      # 每个品种待处理 bar 上限
+POLL_SECONDS = 5.0    # CSV 轮询间隔
+YIELD_EVERY = 256     # 引擎连续处理多少根 bar 后让出事件循环（回放历史时保持各品种轮转）
+GRID_WORKERS = None   # 共享进程池大小（None = CPU 核数）
+MAX_LAG = 1           # 重优化结果最多延后生效的 bar 数（见 StreamEngine）
+
+
+# 只影响引擎、不参与回望网格搜索的 stream_config() 字段，可直接覆盖；
+# 其余（资金 / 仓位 / EMA / 品种规格等）须作为脚本全局参数经 params 传入，重优化与实盘使用同一套规则
+STREAM_ONLY_FIELDS = ("start_date", "initial_cash_base", "lookback_months", "rebalance_months")
+
+
+def instrument_job(symbol, script, csv_path=None, start=None, params=None, **overrides):
+    # 返回 {"symbol", "config", "csv"}；未指定 csv_path 时从数据目录索引中选最新导出，找不到返回 None
+    #   params     脚本全局参数覆盖（见各脚本 configure，如外汇 POINT / CONTRACT_SIZE / LEVERAGE），
+    #              同时作用于引擎配置和进程池中的回望网格搜索
+    #   overrides  覆盖 STREAM_ONLY_FIELDS 中的 stream_config() 字段
+    bad = [k for k in overrides if k not in STREAM_ONLY_FIELDS]
+    if bad:
+        raise KeyError(f"cannot override stream config fields {bad}: only {list(STREAM_ONLY_FIELDS)}; "
+                       f"pass script parameters via params")
+    params = dict(params or {})
+    if params:
+        # 与 wf_batch 相同：重新加载脚本后应用参数覆盖，取得配置后恢复模块默认状态
+        module = importlib.reload(importlib.import_module(script))
+        module.configure(**params)
+        config = module.stream_config()
+        importlib.reload(module)
+    else:
+        config = importlib.import_module(script).stream_config()
+    config["grid_fn"] = functools.partial(_configured_grid, script, params)
+    config.update(overrides)
+    if start is not None:
+        config["start_date"] = start
+    if csv_path is None:
+        files = find_files(get_catalog(DATA_DIR), symbol, config["start_date"])
+        if not files:
+            return None
+        csv_path = files[-1]["path"]
+    return {"symbol": symbol, "config": config, "csv": csv_path}
+
+
+# 进程池 worker 中各脚本当前应用的参数覆盖（不同品种可共用同一脚本、不同参数）；未记录 = 未覆盖
+_APPLIED = {}
+
+
+def _configured_grid(script, params, close, signal):
+    # 回望网格搜索前按该品种的参数配置脚本模块（与当前状态相同时不重新加载）
+    key = repr(sorted(params.items()))
+    module = importlib.import_module(script)
+    if _APPLIED.get(script, repr([])) != key:
+        module = importlib.reload(module)
+        module.configure(**params)
+        _APPLIED[script] = key
+    return module.grid_search_arrays(close, signal)
+
+
+# =========================================================
+# 行情协程
+# =========================================================
+async def csv_feed(csv_path, start=None, poll=POLL_SECONDS, idle_timeout=None):
+    # csv_bars 的异步版本：读文件 / 解析在线程中执行，轮询间隔用 asyncio.sleep
+    loop = asyncio.get_running_loop()
+    updates = csv_updates(csv_path, start)
+    idle_since = loop.time()
+    while True:
+        cols = await asyncio.to_thread(next, updates)
+        if len(cols["time"]):
+            for bar in column_bars(cols):
+                yield bar
+            idle_since = loop.time()
+        elif idle_timeout is not None and loop.time() - idle_since >= idle_timeout:
+            return
+        await asyncio.sleep(poll)
+
+
+async def _pump(feed, queue, stats):
+    async for bar in feed:
+        if queue.full():
+            stats["stalls"] += 1
+        await queue.put(bar)
+    await queue.put(None)
+
+
+async def _drive(symbol, engine, queue, stats, on_event):
+    while True:
+        bar = await queue.get()
+        if bar is None:
+            return
+        stats["max_queue"] = max(stats["max_queue"], queue.qsize() + 1)
+
+        if engine.would_block(bar[0]):
+            # 只有本协程操作该引擎，放到线程中等待不影响状态一致性
+            stats["grid_waits"] += 1
+            events = await asyncio.to_thread(engine.on_bar, *bar)
+        else:
+            events = engine.on_bar(*bar)
+        for event in events:
+            if on_event is not None:
+                on_event(symbol, event)
+
+        stats["bars"] += 1
+        if stats["bars"] % YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+
+
+# =========================================================
+# 调度入口
+# =========================================================
+async def run_instruments(jobs, executor=None, queue_size=QUEUE_SIZE, blocking=False, max_lag=MAX_LAG,
+                          poll=POLL_SECONDS, idle_timeout=None, on_event=None):
+    # jobs 见 instrument_job；job 可带 "feed"（任意 (time, close) 异步迭代器）替代 CSV 跟踪
+    # blocking=True 时每次重优化在触发 bar 上生效（与 main_backtest 逐笔一致），等待期间其他品种照常推进
+    # 返回 {symbol: {"engine", "stats"}}；全部行情结束（idle_timeout）后返回
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=GRID_WORKERS)
+
+    results = {}
+    tasks = []
+    try:
+        for job in jobs:
+            config = job["config"]
+            engine = StreamEngine(config, executor=executor, blocking=blocking, max_lag=max_lag)
+            stats = {"bars": 0, "stalls": 0, "max_queue": 0, "grid_waits": 0}
+            queue = asyncio.Queue(queue_size)
+            feed = job.get("feed") or csv_feed(job["csv"], config["start_date"], poll, idle_timeout)
+            results[job["symbol"]] = {"engine": engine, "stats": stats}
+            tasks.append(asyncio.create_task(_pump(feed, queue, stats)))
+            tasks.append(asyncio.create_task(_drive(job["symbol"], engine, queue, stats, on_event)))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def report_instruments(results):
+    for symbol, r in results.items():
+        engine, stats = r["engine"], r["stats"]
+        pnl = sum(t["PnL"] for t in engine.trades)
+        print(f"{symbol}: {stats['bars']} bars, {len(engine.trades)} trades, PnL {pnl:.2f}, "
+              f"cash_base {engine.cash_base}, backpressure stalls {stats['stalls']} "
+              f"(max queue {stats['max_queue']}), grid waits {stats['grid_waits']}")
+
+
+def print_event(symbol, event):
+    if event["event"] == "signal":
+        return
+    fields = {k: v for k, v in event.items() if k not in ("event", "time", "trade")}
+    if "trade" in event:
+        fields["PnL"] = event["trade"]["PnL"]
+    print(f"[{event['time']}] {symbol} {event['event']} {fields}")
+
+
+# =========================================================
+# 主入口
+# =========================================================
+def main():
+    jobs = []
+    for symbol, script in WATCHLIST.items():
+        job = instrument_job(symbol, script, start=START_DATE)
+        if job is None:
+            print(f"{symbol}: no M30 data in {DATA_DIR}, skipped")
+            continue
+        jobs.append(job)
+    try:
+        results = asyncio.run(run_instruments(jobs, on_event=print_event))
+    except KeyboardInterrupt:
+        return
+    report_instruments(results)
+
+
+if __name__ == "__main__":
+    main()
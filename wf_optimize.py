@@ -0,0 +1,127 @@
+import math
+
+# =========================================================
+# 逐轮减半（successive halving）+ 细化搜索
+# =========================================================
+# 先在回望窗口末尾的短子窗口上评估全部候选，按盈亏保留前 1/eta，
+# 幸存者在更长（eta 倍）的子窗口上重新评估，最后一轮为完整窗口；
+# 可选在完整窗口最优候选附近按更细步长补充评估（coarse-to-fine）
+# 评估量按“完整窗口等价次数”计：在 L 根 bar 上评估一个候选 = L / n 次
+
+
+def halving_plan(n_bars, n_candidates, eta=2, min_bars=200, keep=4, budget=None):
+    # 返回每轮 [(子窗口 bar 数, 评估候选数), ...]，最后一轮为完整窗口
+    # 计划只依赖窗口长度和候选数，与评估结果无关
+    # budget 为完整窗口等价评估次数上限：超出时缩短前几轮子窗口（不短于 min_bars）
+    # 仍超出时由 halving_search 抽稀候选
+    counts = [n_candidates]
+    while counts[-1] > keep:
+        counts.append(max(keep, math.ceil(counts[-1] / eta)))
+    if len(counts) == 1 or n_bars <= min_bars:
+        return [(n_bars, n_candidates)]
+
+    rounds = len(counts)
+    shift = 0
+    while True:
+        lengths = [max(min_bars, n_bars // eta ** (rounds - 1 - k + shift)) for k in range(rounds - 1)]
+        plan = list(zip(lengths + [n_bars], counts))
+        if budget is None or plan_cost(plan, n_bars) <= budget or lengths[-1] <= min_bars:
+            return plan
+        shift += 1
+
+
+def plan_cost(plan, n_bars):
+    return sum(length * count for length, count in plan) / n_bars
+
+
+def refine_candidates(best, step, lo, hi, points=2, existing=()):
+    # best 两侧各 points 个细步长候选（限制在 [lo, hi] 内，去掉已评估的）
+    seen = {round(float(c), 10) for c in existing}
+    extra = []
+    for k in range(-points, points + 1):
+        c = round(float(best) + k * step, 10)
+        if k and lo <= c <= hi and c not in seen:
+            extra.append(c)
+    return extra
+
+
+def halving_search(evaluate, candidates, n_bars, eta=2, min_bars=200, keep=4, budget=None,
+                   refine_step=None, refine_points=2):
+    # evaluate(candidates, start) -> 各候选在子窗口 [start, n_bars) 上的盈亏列表
+    # 返回 ([(candidate, pnl), ...] 完整窗口结果, stats)
+    # refine_step 只适用于数值型（标量）候选
+    candidates = list(candidates)
+    if budget is not None:
+        # 最后一轮完整窗口上的候选数也计入预算：预算不足 keep 次时相应减少保留数
+        if budget < 1:
+            raise ValueError(f"halving budget {budget} is less than one full-window evaluation")
+        keep = max(1, min(keep, int(budget)))
+    # 子窗口缩到 min_bars 仍超出预算时，按等间隔抽稀首轮候选
+    stride = 1
+    while True:
+        pool = candidates[::stride]
+        plan = halving_plan(n_bars, len(pool), eta, min_bars, keep, budget)
+        if budget is None or plan_cost(plan, n_bars) <= budget or len(pool) <= keep:
+            break
+        stride += 1
+
+    survivors = pool
+    for length, count in plan:
+        survivors = survivors[:count]
+        pnls = evaluate(survivors, n_bars - length)
+        # 稳定排序：盈亏相同时保持原候选顺序
+        ranked = sorted(zip(survivors, pnls), key=lambda x: x[1], reverse=True)
+        survivors = [c for c, _ in ranked]
+    results = ranked
+    used = plan_cost(plan, n_bars)
+    # 对照：被替代的穷举网格（全部候选各在完整窗口上评估一次）
+    exhaustive = len(candidates)
+    stats = {}
+
+    if refine_step:
+        lo, hi = min(candidates), max(candidates)
+        extra = refine_candidates(ranked[0][0], refine_step, lo, hi, refine_points, [c for c, _ in ranked])
+        if budget is not None:
+            extra = extra[:max(int(budget - used), 0)]
+        if extra:
+            results = results + list(zip(extra, evaluate(extra, 0)))
+            used += len(extra)
+        # 附加对照：同样细步长的穷举网格
+        stats["refine_grid"] = int(round((hi - lo) / refine_step)) + 1
+
+    stats.update(evaluations=used, exhaustive=exhaustive, saved=exhaustive - used)
+    return results, stats
+
+
+def report_halving(stats_list):
+    # 汇总全部重优化窗口：相对穷举候选网格节省的完整窗口等价评估次数
+    used = sum(s["evaluations"] for s in stats_list)
+    exhaustive = sum(s["exhaustive"] for s in stats_list)
+    saved = exhaustive - used
+    pct = saved / exhaustive * 100 if exhaustive else 0.0
+    refine = sum(s.get("refine_grid", 0) for s in stats_list)
+    print(f"Halving optimiser: {len(stats_list)} windows, {used:.1f} full-window evaluations "
+          f"vs {exhaustive} exhaustive, saved {saved:.1f} ({pct:.1f}%)"
+          + (f"; exhaustive at refine step would be {refine}" if refine else ""))
+    return {"windows": len(stats_list), "evaluations": used, "exhaustive": exhaustive, "saved": saved,
+            "refine_grid": refine}
+
+
+def report_pruning(stats_list):
+    # 汇总回望网格剪枝：淘汰的候选数及跳过的候选 × bar 数（全部命中缓存时不输出）
+    total = {k: sum(s.get(k, 0) for s in stats_list) for k in ("drawdown", "rank", "bars_skipped", "bars_total")}
+    if total["bars_total"]:
+        pct = total["bars_skipped"] / total["bars_total"] * 100
+        print(f"Grid pruning: {total['drawdown']} drawdown / {total['rank']} rank-resolved candidates, "
+              f"{total['bars_skipped']} of {total['bars_total']} candidate-bars skipped ({pct:.1f}%)")
+    return total
+
+
+def report_cache(stats_list):
+    # 汇总回望网格结果缓存的命中 / 未命中 / 淘汰条目数（未启用缓存时不输出）
+    total = {k: sum(s.get(k, 0) for s in stats_list) for k in ("hits", "misses", "evictions")}
+    lookups = total["hits"] + total["misses"]
+    if lookups:
+        print(f"Grid cache: {total['hits']} hits / {total['misses']} misses "
+              f"({total['hits'] / lookups * 100:.1f}% hit rate), {total['evictions']} evictions")
+    return total
@@ -0,0 +1,234 @@
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from m30_catalog import get_catalog, find_files
+from m30_data import label_bounds
+from m30_store import DEFAULT_STORE_DIR, attach, ensure_store
+from wf_kernel import extract_arrays, signal_array
+from wf_live import WATCHLIST
+from wf_schedule import build_rebalance_schedule, run_grid_searches, run_sliding_searches
+from wf_slide import report_sliding
+
+# =========================================================
+# 滚动起点 Walk-Forward 分布（同一品种从多个起始日并行回测）
+# =========================================================
+# 马丁仓位下结果对起始 bar 非常敏感：在 [ORIGIN_FROM, ORIGIN_TO) 内每隔 ORIGIN_EVERY 个交易日取一个起点，
+# 每个起点的结果与把脚本 START_DATE 设为该日运行完全一致（EMA 从起点开始计算），
+# 汇总最终盈亏 / 最大马丁层级 / 最大回撤的分布
+# 共享：
+#   行情      内存映射存储（见 m30_store），各 worker attach 同一文件，不重复解析 CSV
+#   回望网格  不同起点的重优化窗口大量重叠：信号与参照序列（最早起点的 EMA）逐 bar 相同的窗口
+#             只计算一次，并按时间顺序增量评估（见 wf_slide）；起点附近 EMA 尚未收敛的窗口单独计算；
+#             结果写入脚本的 GRID_CACHE_FILE，重复运行直接命中
+ORIGIN_FROM = "2024-01-01"
+ORIGIN_TO = "2025-01-01"
+ORIGIN_EVERY = 1        # 每隔几个交易日取一个起点
+ORIGIN_WORKERS = None   # None = CPU 核数
+DATA_DIR = "."
+STORE_DIR = DEFAULT_STORE_DIR
+PERCENTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def origin_dates(times, first, last=None, every=1):
+    # [first, last) 内有 bar 的交易日（"YYYY-MM-DD"），每隔 every 个取一个
+    times = np.asarray(times)
+    lo = np.searchsorted(times, label_bounds(first)[0].value, side="left")
+    hi = len(times) if last is None else np.searchsorted(times, label_bounds(last)[0].value, side="left")
+    days = pd.DatetimeIndex(times[lo:hi].view("datetime64[ns]")).normalize().unique()
+    return [d.strftime("%Y-%m-%d") for d in days[::every]]
+
+
+# =========================================================
+# worker（每个进程按参数加载脚本并 attach 行情存储）
+# =========================================================
+_MODULE = None
+_COLS = None
+
+
+def _init_worker(script, symbol, overrides, store_dir):
+    # 与 wf_batch 相同：重新加载脚本后应用参数覆盖，不受父进程中脚本状态影响
+    global _MODULE, _COLS
+    _MODULE = importlib.reload(importlib.import_module(script))
+    _MODULE.configure(**overrides)
+    _COLS = attach(symbol, store_dir)
+
+
+def _origin_frame(a, b):
+    # 行 [a, b) 的 DataFrame，与脚本 load_data(START_DATE = 第 a 行所在日) 相同：EMA 从起点开始计算
+    m = _MODULE
+    index = pd.DatetimeIndex(np.asarray(_COLS["time"][a:b]).view("datetime64[ns]"), name="datetime")
+    df = pd.DataFrame({"close": np.array(_COLS["close"][a:b])}, index=index)
+    df["ema_fast"] = df["close"].ewm(span=m.FAST_EMA, adjust=False).mean()
+    df["ema_slow"] = df["close"].ewm(span=m.SLOW_EMA, adjust=False).mean()
+    return df
+
+
+def _frame_signal(df):
+    _, ema_fast, ema_slow = extract_arrays(df)
+    return signal_array(ema_fast, ema_slow)
+
+
+def _plan(origins, end):
+    # 各起点的行区间 [a, b) 与回望窗口：信号与参照序列相同的窗口记为全局 (start, end)（共享），否则 None
+    m = _MODULE
+    times = np.asarray(_COLS["time"])
+    end_ts = label_bounds(None, m.END_DATE if end is None else end)[1]
+    b = len(times) if end_ts is None else int(np.searchsorted(times, end_ts.value, side="right"))
+    starts = [int(np.searchsorted(times, label_bounds(o)[0].value, side="left")) for o in origins]
+    a0 = min(starts)
+    ref = _origin_frame(a0, b)
+    ref_signal = _frame_signal(ref)
+
+    plans = []
+    for origin, a in zip(origins, starts):
+        df = _origin_frame(a, b)
+        signal = _frame_signal(df)
+        off = a - a0
+        windows = []
+        for _, start, stop in build_rebalance_schedule(df.index, origin, m.LOOKBACK_MONTHS, m.REBALANCE_MONTHS):
+            shared = np.array_equal(signal[start:stop], ref_signal[off + start:off + stop])
+            windows.append((a + start, a + stop) if shared else None)
+        plans.append({"origin": origin, "a": a, "b": b, "windows": windows})
+    return {"a0": a0, "close": ref["close"].to_numpy(), "signal": ref_signal, "plans": plans,
+            "sliding": m.GRID_SLIDING and m.GRID_OPTIMIZER == "grid"}
+
+
+def _sliding_details(close, signal, windows):
+    return _MODULE.sliding_grid_details(close, signal, windows)
+
+
+def _grid_detail(close, signal):
+    return _MODULE.grid_search_detail(close, signal)
+
+
+def _run_origin(origin, a, b, choices):
+    # choices 与该起点的重优化计划一一对应；None 为私有窗口，在此计算
+    m = _MODULE
+    m.configure(START_DATE=origin)
+    t0 = time.perf_counter()
+    df = _origin_frame(a, b)
+    if None in choices:
+        close, signal = df["close"].to_numpy(), _frame_signal(df)
+        schedule = build_rebalance_schedule(df.index, origin, m.LOOKBACK_MONTHS, m.REBALANCE_MONTHS)
+        choices = [c if c is not None else m.grid_search_arrays(close[start:stop], signal[start:stop])
+                   for c, (_, start, stop) in zip(choices, schedule)]
+    trades, equity = m.main_backtest(df, choices)
+    return origin_summary(origin, df, trades, equity, m.INITIAL_CASH, time.perf_counter() - t0)
+
+
+def origin_summary(origin, df, trades, equity, initial_cash, seconds=0.0):
+    wins = sum(1 for t in trades if t["PnL"] > 0)
+    # 最大回撤按已实现净值曲线（与 HTML 报告的净值图相同）
+    curve = np.asarray(equity if equity else [initial_cash], dtype=np.float64)
+    peak = np.maximum.accumulate(curve)
+    dd = peak - curve
+    k = int(np.argmax(dd))
+    return {
+        "origin": origin,
+        "first_bar": df.index[0] if len(df) else None,
+        "bars": len(df),
+        "trades": len(trades),
+        "win_rate": round(wins / len(trades) * 100, 2) if trades else 0.0,
+        "pnl": round(sum(t["PnL"] for t in trades), 2),
+        "final_equity": equity[-1] if equity else initial_cash,
+        "max_level": max((t["Martingale Level"] for t in trades), default=0),
+        "max_drawdown": round(float(dd[k]), 2),
+        "max_drawdown_pct": round(float(dd[k] / peak[k] * 100), 2) if peak[k] > 0 else 0.0,
+        "seconds": round(seconds, 4),
+    }
+
+
+# =========================================================
+# 调度
+# =========================================================
+def symbol_csv(symbol, start=None):
+    files = find_files(get_catalog(DATA_DIR), symbol, start)
+    if not files:
+        raise FileNotFoundError(f"no M30 data for {symbol} in {DATA_DIR}")
+    return files[-1]["path"]
+
+
+def run_origins(symbol, script=None, first=ORIGIN_FROM, last=ORIGIN_TO, every=ORIGIN_EVERY, end=None,
+                overrides=None, max_workers=ORIGIN_WORKERS, csv_path=None, store_dir=STORE_DIR):
+    # 返回每个起点一行的 DataFrame（按起点排序）
+    #   script     使用的脚本（默认按 WATCHLIST）；overrides 为脚本全局参数覆盖（见 configure）
+    #   end        所有起点共同的结束日（None = 脚本 END_DATE）
+    script = script or WATCHLIST[symbol]
+    overrides = dict(overrides or {})
+    csv_path = csv_path or symbol_csv(symbol, first)
+    ensure_store(symbol, csv_path, store_dir=store_dir)
+    origins = origin_dates(attach(symbol, store_dir)["time"], first, last, every)
+    if not origins:
+        raise ValueError(f"no {symbol} bars in [{first}, {last})")
+
+    t0 = time.perf_counter()
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(script, symbol, overrides, store_dir)) as ex:
+        plan = ex.submit(_plan, origins, end).result()
+
+        # 共享窗口按起点排序后一次性计算（相邻起点的窗口只错开一天，增量评估几乎全部复用）
+        a0 = plan["a0"]
+        keys = sorted({w for p in plan["plans"] for w in p["windows"] if w is not None})
+        schedule = [(stop - a0, start - a0, stop - a0) for start, stop in keys]
+        if plan["sliding"]:
+            details = run_sliding_searches(_sliding_details, plan["close"], plan["signal"], schedule, max_workers, ex)
+            report_sliding([stats["sliding"] for _, stats in details])
+        else:
+            details = run_grid_searches(_grid_detail, plan["close"], plan["signal"], schedule, max_workers, ex)
+        shared = {k: choice for k, (choice, _) in zip(keys, details)}
+        private = sum(w is None for p in plan["plans"] for w in p["windows"])
+        print(f"Rolling origins: {len(origins)} starts, {len(keys)} shared lookback windows, {private} private")
+
+        futures = [ex.submit(_run_origin, p["origin"], p["a"], p["b"],
+                             [None if w is None else shared[w] for w in p["windows"]])
+                   for p in plan["plans"]]
+        rows = []
+        for n, fut in enumerate(as_completed(futures), 1):
+            rows.append(fut.result())
+            if n % 50 == 0 or n == len(futures):
+                print(f"[{n}/{len(futures)}] {time.perf_counter() - t0:.1f}s")
+
+    elapsed = time.perf_counter() - t0
+    print(f"Throughput: {len(rows) / elapsed * 60:.0f} origins/min ({len(rows)} origins, {elapsed:.1f}s)")
+    return pd.DataFrame(rows).sort_values("origin", ignore_index=True)
+
+
+def origin_distribution(results, percentiles=PERCENTILES):
+    # 最终盈亏 / 最大马丁层级 / 最大回撤在各起点间的分布
+    columns = ["pnl", "max_level", "max_drawdown", "max_drawdown_pct", "trades"]
+    return results[columns].describe(percentiles=percentiles)
+
+
+# =========================================================
+# 主入口
+# =========================================================
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward result distribution over many start dates")
+    parser.add_argument("symbol")
+    parser.add_argument("--script", help="walk-forward script (default: by watchlist)")
+    parser.add_argument("--from", dest="first", default=ORIGIN_FROM)
+    parser.add_argument("--to", dest="last", default=ORIGIN_TO)
+    parser.add_argument("--every", type=int, default=ORIGIN_EVERY, help="trading days between start dates")
+    parser.add_argument("--end", help="common end date (default: script END_DATE)")
+    parser.add_argument("--params", default="{}", help='JSON overrides, e.g. {"MARTINGALE_MULT": 1.5}')
+    parser.add_argument("--workers", type=int, default=ORIGIN_WORKERS)
+    args = parser.parse_args()
+
+    results = run_origins(args.symbol, args.script, args.first, args.last, args.every, args.end,
+                          json.loads(args.params), args.workers)
+    out = f"{args.symbol}_Rolling_Origins.csv"
+    results.to_csv(out, index=False)
+    print(origin_distribution(results).round(2).to_string())
+    print(f"Per-origin results saved: {out}")
+
+
+if __name__ == "__main__":
+    main()
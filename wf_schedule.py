@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+# =========================================================
+# Walk-Forward 重优化计划（整数窗口，股票 / 外汇脚本共用）
+# =========================================================
+def epoch_index(index):
+    # DatetimeIndex -> int64 纳秒时间戳（要求按时间升序）
+    return np.asarray(pd.DatetimeIndex(index).as_unit("ns").asi8)
+
+
+def build_rebalance_schedule(index, start_date, lookback_months, step_months=None):
+    # 返回 [(bar, start, end), ...]：
+    #   bar        触发回望网格搜索的 bar 位置
+    #   start/end  回望窗口 [start, end)，等价于 df.loc[time - lookback:time]
+    # 触发规则与原逐 bar 判断一致：首次 time >= start_date + lookback，
+    # 之后 time >= 上次重优化时间 + step（step_months 为 None 时等于 lookback，窗口互不重叠）
+    epochs = epoch_index(index)
+    lookback = relativedelta(months=lookback_months)
+    step = lookback if step_months is None else relativedelta(months=step_months)
+    n = len(epochs)
+
+    schedule = []
+    next_grid_time = pd.to_datetime(start_date) + lookback
+    while True:
+        bar = int(np.searchsorted(epochs, next_grid_time.value, side="left"))
+        if bar >= n:
+            break
+        time = pd.Timestamp(epochs[bar])
+        start = int(np.searchsorted(epochs, (time - lookback).value, side="left"))
+        end = int(np.searchsorted(epochs, epochs[bar], side="right"))
+        schedule.append((bar, start, end))
+        next_grid_time = time + step
+    return schedule
+
+
+# =========================================================
+# 并行预计算全部回望网格搜索
+# =========================================================
+def run_grid_searches(grid_fn, close, signal, schedule, max_workers=None, executor=None):
+    # 回望窗口只依赖数据，不依赖实盘状态，因此可提前并行计算
+    # grid_fn(close_window, signal_window) -> cash_base，需为模块级函数（可 pickle）
+    # executor 为已有进程池时总在池中执行（如 wf_origins 中按参数加载好脚本的 worker）
+    # 返回与 schedule 一一对应的 cash_base 列表
+    windows = [(close[start:end], signal[start:end]) for _, start, end in schedule]
+    max_workers = max_workers or os.cpu_count() or 1
+    if executor is None and (max_workers == 1 or len(windows) < 2):
+        return [grid_fn(c, s) for c, s in windows]
+
+    # 大窗口优先提交，结果仍按 schedule 顺序返回
+    order = sorted(range(len(windows)), key=lambda k: len(windows[k][0]), reverse=True)
+    choices = [None] * len(windows)
+    with _pool(executor, min(max_workers, len(windows))) as ex:
+        futures = {k: ex.submit(grid_fn, *windows[k]) for k in order}
+        for k, fut in futures.items():
+            choices[k] = fut.result()
+    return choices
+
+
+def run_sliding_searches(detail_fn, close, signal, schedule, max_workers=None, executor=None):
+    # 相邻窗口重叠时按时间顺序评估（见 wf_slide）：schedule 按顺序切成连续的段，每个进程一段
+    # detail_fn(close_span, signal_span, windows) -> 与 windows 对应的结果列表，
+    # windows 为相对该段起点的 [(start, end), ...]；需为模块级函数（可 pickle）
+    # executor 同 run_grid_searches；返回与 schedule 一一对应的结果
+    max_workers = max_workers or os.cpu_count() or 1
+    parts = np.array_split(np.arange(len(schedule)), min(max_workers, max(len(schedule), 1)))
+    spans = []
+    for part in parts:
+        if not len(part):
+            continue
+        windows = [schedule[k][1:] for k in part]
+        lo = min(start for start, _ in windows)
+        hi = max(end for _, end in windows)
+        spans.append((close[lo:hi], signal[lo:hi], [(start - lo, end - lo) for start, end in windows]))
+    if executor is None and len(spans) < 2:
+        return [r for span in spans for r in detail_fn(*span)]
+
+    with _pool(executor, len(spans)) as ex:
+        futures = [ex.submit(detail_fn, *span) for span in spans]
+        return [r for fut in futures for r in fut.result()]
+
+
+@contextmanager
+def _pool(executor, max_workers):
+    # 使用传入的进程池（不关闭），或临时创建一个
+    if executor is not None:
+        yield executor
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        yield ex
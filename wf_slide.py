@@ -0,0 +1,187 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from wf_instrument import STOCK
+from wf_kernel import LONG, PRUNED, INSUFFICIENT_CASH, _exit_band, build_range_table, find_exit
+
+# =========================================================
+# 滑动窗口增量网格评估（相邻回望窗口重叠时复用交易路径）
+# =========================================================
+# 不考虑资金 / 回撤限制时，一个 cash_base 候选的开平仓序列只由起点决定：
+#   两条路径在同一 bar 平仓后都空仓、size 相同（信号为同一序列）时，之后的交易完全相同
+# 新窗口从起点模拟到与已有路径重新同步为止，之后的交易直接沿用；
+# 已有路径只在窗口向后延伸时追加模拟新 bar（频繁重优化的额外开销约等于新增 bar 的部分）
+# 资金按原顺序逐笔累加已实现盈亏，资金检查 / 回撤剪枝在拼接后的交易序列上判断，
+# 结果与 run_pnl_grid(close[start:end], signal[start:end], ...) 逐位一致（不做排名剪枝）
+
+
+class TradePath:
+    # 从 origin 空仓、初始 size 出发的交易路径（不做资金检查，按需向后模拟）
+    # 事件 k：bars[k] 平仓后空仓（k = 0 为起点，pnls[0] = 0），之后 size 为 sizes[k]，
+    #   在 opens[k]（>= bars[k] 的第一个非零信号 bar，不存在为 n）开仓；
+    #   highs[k] 为空仓期间 [bars[k], opens[k]] 的最高价（保证金检查用）
+    def __init__(self, grid, cash_base, origin):
+        self.grid = grid
+        self.threshold_unit = grid.spec.threshold_unit(cash_base)
+        self.distance = cash_base * grid.spec.band_unit
+        self.bars, self.pnls, self.sizes, self.opens, self.highs = [], [], [], [], []
+        self._flat(origin, 0.0, grid.initial_size)
+
+    def _flat(self, bar, pnl, size):
+        g = self.grid
+        o = g.next_open[bar]
+        self.bars.append(bar)
+        self.pnls.append(pnl)
+        self.sizes.append(size)
+        self.opens.append(o)
+        self.highs.append(g.close[bar] if o == bar else max(g.close[bar:o + 1]))
+        self.pos = g.signal[o] if o < g.n else 0
+        if self.pos:
+            self.entry = g.close[o]
+            self.lo, self.hi = _exit_band(self.entry, self.distance)
+            self.scan = o + 1
+
+    def step(self):
+        # 模拟到下一次平仓并追加事件；行情结束前不再平仓时返回 False
+        if not self.pos:
+            return False
+        g = self.grid
+        size = self.sizes[-1]
+        j = self.scan
+        while True:
+            j = find_exit(g.table, j, self.lo, self.hi)
+            if j >= g.n:
+                self.scan = j
+                return False
+            price = g.close[j]
+            diff = price - self.entry if self.pos == LONG else self.entry - price
+            pnl = diff * g.value * size
+            if abs(pnl) >= self.threshold_unit * size:
+                break
+            j += 1
+
+        if pnl > 0:
+            size = g.initial_size
+        else:
+            size = g.spec.normalize_size(size * g.mult, size)
+            if g.max_size is not None and size > g.max_size:
+                size = g.max_size
+        self._flat(j, pnl, size)
+        return True
+
+    def cover(self, bar):
+        # 模拟到 bar 及之前的事件全部已知
+        while self.bars[-1] <= bar and self.step():
+            pass
+
+    def flat_at(self, bar, size):
+        # bar 平仓判断之后本路径空仓且 size 相同时返回该事件下标（两条路径在此同步），否则 None
+        self.cover(bar)
+        k = bisect_right(self.bars, bar) - 1
+        if k >= 0 and self.sizes[k] == size and self.opens[k] >= bar:
+            return k
+        return None
+
+
+class SlidingGrid:
+    # 同一段行情上按时间顺序评估多个回望窗口 [start, end)，每个 cash_base 保留一条最近的路径
+    # 参数同 run_pnl_grid（mult 为标量）；窗口按起点升序评估时复用最多，乱序时结果仍正确
+    def __init__(self, close, signal, cash_bases, initial_cash, initial_size, mult,
+                 max_size=None, spec=STOCK, check_cash=False, max_drawdown=None):
+        self.table = build_range_table(close)
+        self.close = self.table["close"]
+        self.n = n = self.table["n"]
+        signal = np.asarray(signal)
+        self.signal = signal.tolist()
+        # next_open[t] = t 及之后第一个非零信号的 bar（不存在为 n）
+        nz = np.where(signal != 0, np.arange(n), n)
+        self.next_open = np.minimum.accumulate(nz[::-1])[::-1].tolist() + [n]
+
+        self.cash_bases = [float(cb) for cb in cash_bases]
+        self.initial_cash = initial_cash
+        self.initial_size = initial_size
+        self.mult = mult
+        self.max_size = max_size
+        self.spec = spec
+        self.value = spec.price_value
+        self.check_cash = check_cash
+        self.max_drawdown = max_drawdown
+        self.paths = {}
+
+    def evaluate(self, start, end, cash_bases=None, stats=None):
+        # 返回与 run_pnl_grid(close[start:end], signal[start:end], cash_bases, ...) 相同的结果
+        # stats：dict，累加 candidates / synced（与已有路径重新同步的候选数）/ trades / reused（沿用的交易数）
+        if cash_bases is None:
+            cash_bases = self.cash_bases
+        result = []
+        for cb in cash_bases:
+            cb = float(cb)
+            ref = self.paths.get(cb)
+            if ref is not None and ref.bars[0] > start:
+                ref = None
+
+            own = TradePath(self, cb, start)
+            k = None
+            while own.bars[-1] < end:
+                if ref is not None:
+                    k = ref.flat_at(own.bars[-1], own.sizes[-1])
+                    if k is not None:
+                        break
+                if not own.step():
+                    break
+
+            if k is None:
+                # 窗口内未同步：本窗口路径作为之后窗口的参照
+                self.paths[cb] = own
+                m = bisect_left(own.bars, end)
+                pnls, sizes, highs = own.pnls[1:m], own.sizes[:m], own.highs[:m]
+                last_bar, last_open = own.bars[m - 1], own.opens[m - 1]
+                reused = 0
+            else:
+                ref.cover(end - 1)
+                m = bisect_left(ref.bars, end)
+                pnls = own.pnls[1:] + ref.pnls[k + 1:m]
+                sizes = own.sizes + ref.sizes[k + 1:m]
+                highs = own.highs + ref.highs[k + 1:m]
+                if m > k + 1:
+                    last_bar, last_open = ref.bars[m - 1], ref.opens[m - 1]
+                else:
+                    last_bar, last_open = own.bars[-1], own.opens[-1]
+                reused = m - k - 1
+            if last_open >= end:
+                # 最后一段空仓被窗口截断
+                highs[-1] = max(self.close[last_bar:end])
+
+            result.append(self._replay(pnls, sizes, highs))
+            if stats is not None:
+                stats["candidates"] = stats.get("candidates", 0) + 1
+                stats["synced"] = stats.get("synced", 0) + (k is not None)
+                stats["trades"] = stats.get("trades", 0) + len(pnls)
+                stats["reused"] = stats.get("reused", 0) + reused
+        return result
+
+    def _replay(self, pnls, sizes, highs):
+        # 逐笔累加（np.cumsum 为顺序累加，与逐 bar 模拟的 cash += pnl 相同）
+        cash = np.cumsum(np.array([self.initial_cash] + pnls, dtype=np.float64))
+        if self.max_drawdown is not None and len(pnls):
+            peak = np.maximum.accumulate(cash)[:-1]
+            after = cash[1:]
+            if np.any((after <= peak) & (peak - after > self.max_drawdown)):
+                return PRUNED
+        if self.check_cash:
+            # 空仓期间每个 bar 检查保证金；价格越高要求越高，只需检查每段最高价
+            required = np.array(highs) * self.value * np.array(sizes) / self.spec.leverage
+            if np.any(cash < required):
+                return INSUFFICIENT_CASH
+        return float(cash[-1]) - self.initial_cash
+
+
+def report_sliding(stats_list):
+    # 汇总滑动窗口评估：重新同步的候选窗口数及沿用的交易数（全部命中缓存时不输出）
+    total = {k: sum(s.get(k, 0) for s in stats_list) for k in ("candidates", "synced", "trades", "reused")}
+    if total["candidates"]:
+        pct = total["reused"] / total["trades"] * 100 if total["trades"] else 0.0
+        print(f"Sliding grid: {total['synced']} of {total['candidates']} candidate windows re-synchronised, "
+              f"{total['reused']} of {total['trades']} trades reused ({pct:.1f}%)")
+    return total
@@ -0,0 +1,247 @@
+import time as _time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from m30_data import load_m30_ingested, read_m30_tail, slice_columns, label_bounds, source_stamp
+from wf_instrument import STOCK
+from wf_kernel import LONG, SHORT
+
+# =========================================================
+# 流式（实盘 / 模拟盘）Walk-Forward 引擎
+# =========================================================
+# 逐 bar 推进，状态机与各脚本 main_backtest 相同：EMA 增量递推、持仓 / 马丁状态
+# 每个 bar 的工作量为常数；到达 LOOKBACK_MONTHS 重优化时间点时，
+# 回望窗口的网格搜索提交到后台进程，结果就绪后从之后的 bar 起生效
+# （最多延后 max_lag 根 bar，超过则等待结果，避免快速回放历史时长期使用旧参数）
+# blocking=True 时在触发 bar 上等待结果，与 main_backtest 逐笔一致（用于回放核对）
+#
+# config 由各脚本 stream_config() 提供：
+#   initial_cash / initial_size / mult / fast_ema / slow_ema / initial_cash_base
+#   lookback_months / start_date / grid_fn（回望窗口 (close, signal) -> cash_base）
+#   rebalance_months（可选，重优化间隔；缺省或 None 时等于 lookback_months）
+#   spec（品种规格，见 wf_instrument；外汇 size 为手数，交易记录字段为 Lots）
+
+
+class EmaState:
+    # 与 ewm(span=span, adjust=False).mean() 逐位一致的增量 EMA（同 wf_kernel.ema_extend）
+    def __init__(self, span, value=None):
+        self.alpha = 2.0 / (span + 1)
+        self.old_wt = 1.0 - self.alpha
+        self.value = value
+
+    def update(self, x):
+        w = self.value
+        if w is None:
+            w = x
+        elif w != x:
+            w = (self.old_wt * w + self.alpha * x) / (self.old_wt + self.alpha)
+        self.value = w
+        return w
+
+
+class StreamEngine:
+    def __init__(self, config, executor=None, blocking=False, max_lag=1):
+        self.cfg = config
+        self.spec = config.get("spec", STOCK)
+        self.blocking = blocking
+        self.max_lag = max_lag
+        self.executor = executor
+        self._own_executor = False
+
+        self.ema_fast = EmaState(config["fast_ema"])
+        self.ema_slow = EmaState(config["slow_ema"])
+        self.cash = config["initial_cash"]
+        self.size = config["initial_size"]
+        self.pos = None
+        self.entry_price = None
+        self.entry_time = None
+        self.martingale_level = 0
+        self.cash_base = config["initial_cash_base"]
+        self.last_signal = 0
+
+        self.trades = []
+        self.equity_curve = []
+        self.bars = 0
+
+        # 回望窗口所需的最近 bar：(time, close, signal)，只在重优化时裁剪
+        self.lookback = relativedelta(months=config["lookback_months"])
+        step = config.get("rebalance_months")
+        self.step = self.lookback if step is None else relativedelta(months=step)
+        self.next_grid_time = pd.Timestamp(config["start_date"]) + self.lookback
+        self.history = deque()
+        self.pending = None
+
+    # ---------------- 重优化 ----------------
+    def _submit_grid(self, time):
+        cutoff = time - self.lookback
+        while self.history and self.history[0][0] < cutoff:
+            self.history.popleft()
+        close = np.array([h[1] for h in self.history], dtype=np.float64)
+        signal = np.array([h[2] for h in self.history], dtype=np.int8)
+
+        if self.blocking and self.executor is None:
+            future = Future()
+            future.set_result(self.cfg["grid_fn"](close, signal))
+        else:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=1)
+                self._own_executor = True
+            future = self.executor.submit(self.cfg["grid_fn"], close, signal)
+        self.pending = (future, time, self.bars)
+
+    def _apply_grid(self, time, events):
+        future, requested, _ = self.pending
+        self.cash_base = future.result()
+        events.append({"event": "rebalance", "time": time, "requested": requested, "cash_base": self.cash_base})
+        self.pending = None
+
+    def would_block(self, time):
+        # on_bar(time) 是否会等待重优化结果（事件循环中调度时改在线程中执行该 bar）
+        if time >= self.next_grid_time and (self.blocking or self.pending is not None or self.max_lag <= 0):
+            return True
+        if self.pending is None or self.pending[0].done():
+            return False
+        return self.blocking or self.bars + 1 - self.pending[2] >= self.max_lag
+
+    # ---------------- 单 bar 推进 ----------------
+    def on_bar(self, time, price):
+        # 返回本 bar 产生的事件列表（signal / rebalance / fill）
+        cfg = self.cfg
+        events = []
+        fast = self.ema_fast.update(price)
+        slow = self.ema_slow.update(price)
+        sig = LONG if fast > slow else SHORT if fast < slow else 0
+        if sig != self.last_signal:
+            events.append({"event": "signal", "time": time, "signal": sig})
+            self.last_signal = sig
+
+        self.equity_curve.append(round(self.cash, 2))
+        self.history.append((time, price, sig))
+        self.bars += 1
+
+        # === 回望参数更新 ===
+        if time >= self.next_grid_time:
+            if self.pending is not None:
+                # 上一次重优化尚未生效（极少见）：先等待并应用
+                self._apply_grid(time, events)
+            self._submit_grid(time)
+            self.next_grid_time = time + self.step
+        if self.pending is not None:
+            future, _, bar = self.pending
+            if self.blocking or future.done() or self.bars - bar >= self.max_lag:
+                self._apply_grid(time, events)
+
+        # === 平仓判断 ===
+        spec = self.spec
+        if self.pos:
+            size = self.size
+            diff = price - self.entry_price if self.pos == "LONG" else self.entry_price - price
+            pnl = diff * spec.price_value * size
+            threshold = spec.threshold_unit(self.cash_base) * size
+
+            if abs(pnl) >= threshold:
+                self.cash += pnl
+                trade = self._trade_row(time, price, pnl)
+                self.trades.append(trade)
+                events.append({"event": "fill", "action": "close", "time": time, "price": price, "trade": trade})
+
+                if pnl > 0:
+                    self.size = cfg["initial_size"]
+                    self.martingale_level = 0
+                else:
+                    self.size = spec.normalize_size(self.size * cfg["mult"], self.size)
+                    self.martingale_level += 1
+
+                self.pos = None
+                self.entry_price = None
+                self.entry_time = None
+
+        # === 开仓（资金 / 保证金检查） ===
+        if not self.pos and sig:
+            if self.cash >= spec.margin(price, self.size):
+                self.pos = "LONG" if sig > 0 else "SHORT"
+                self.entry_price = price
+                self.entry_time = time
+                events.append({"event": "fill", "action": "open", "time": time, "direction": self.pos,
+                               "price": price, "size": self.size})
+
+        return events
+
+    def _trade_row(self, time, price, pnl):
+        digits = self.spec.price_digits
+        return {
+            "Entry Time": self.entry_time,
+            "Exit Time": time,
+            "Direction": self.pos,
+            self.spec.size_field: self.size,
+            "Martingale Level": self.martingale_level,
+            "Cash Base": self.cash_base,
+            "Entry Price": round(self.entry_price, digits),
+            "Exit Price": round(price, digits),
+            "PnL": round(pnl, 2),
+            "Equity": round(self.cash, 2)
+        }
+
+    def run(self, bars, on_event=None):
+        # bars 为 (time, close) 的任意可迭代对象（本地 CSV 跟踪 / 券商行情等）
+        for time, price in bars:
+            for event in self.on_bar(time, price):
+                if on_event is not None:
+                    on_event(event)
+        return self.trades, self.equity_curve
+
+    def close(self):
+        if self._own_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self._own_executor = False
+
+
+# =========================================================
+# 行情来源：跟踪本地 MT5 导出 CSV
+# =========================================================
+def csv_updates(csv_path, start=None):
+    # 生成器：首次 next() 返回 start 起已有的 bar 列 {time, close}，
+    # 之后每次 next() 轮询一次文件，返回新追加的完整行（可能为空），本身不等待
+    # 只解析新增字节（见 m30_data.read_m30_tail）；文件被改写时重新摄入，只返回更新的 bar
+    stamp = source_stamp(csv_path)
+    cols, offset, marker = load_m30_ingested(csv_path)
+    cols = slice_columns(cols, label_bounds(start)[0], None)
+    last = None
+    while True:
+        if len(cols["time"]):
+            last = cols["time"][-1]
+        yield cols
+
+        new_stamp = source_stamp(csv_path)
+        tail = read_m30_tail(csv_path, offset, marker, last, columns=["close"], stamp=stamp)
+        stamp = new_stamp
+        if tail is None:
+            cols, offset, marker = load_m30_ingested(csv_path)
+            cols = slice_columns(cols, label_bounds(start)[0], None)
+            if last is not None:
+                keep = cols["time"] > last
+                cols = {k: v[keep] for k, v in cols.items()}
+        else:
+            cols, offset, marker = tail
+
+
+def column_bars(cols):
+    return zip(map(pd.Timestamp, cols["time"].tolist()), cols["close"].tolist())
+
+
+def csv_bars(csv_path, start=None, follow=True, poll=5.0, idle_timeout=None):
+    # 先按时间顺序输出 start 起已有的 bar，再每 poll 秒跟踪文件末尾新追加的完整行
+    # idle_timeout 秒内没有新 bar 时结束（None = 一直跟踪）
+    idle_since = _time.monotonic()
+    for cols in csv_updates(csv_path, start):
+        if len(cols["time"]):
+            yield from column_bars(cols)
+            idle_since = _time.monotonic()
+        if not follow or (idle_timeout is not None and _time.monotonic() - idle_since >= idle_timeout):
+            return
+        _time.sleep(poll)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from wf_kernel import run_pnl_grid, signal_array
+
+# =========================================================
+# 多维参数扫描：FAST_EMA × SLOW_EMA × MARTINGALE_MULT × cash_base
+# =========================================================
+# 每个不同的 EMA span 只计算一次，存成 span × bars 矩阵，所有组合按行复用
+# 同一组 (fast, slow) 的全部 (mult, cash_base) 候选在一次 run_pnl_grid 扫描中推进
+# 结果为带坐标的 N 维数组，可直接切片 / 聚合画热力图
+SWEEP_DIMS = ("fast_ema", "slow_ema", "mult", "cash_base")
+
+
+def ema_matrix(close, spans):
+    # 返回 (去重升序的 spans, 矩阵)，矩阵第 k 行为 spans[k] 的 EMA
+    # 与脚本中 close.ewm(span=span, adjust=False).mean() 逐位一致
+    spans = sorted(set(spans))
+    series = pd.Series(np.asarray(close, dtype=np.float64))
+    mat = np.empty((len(spans), len(series)), dtype=np.float64)
+    for k, span in enumerate(spans):
+        mat[k] = series.ewm(span=span, adjust=False).mean().to_numpy()
+    return spans, mat
+
+
+def run_sweep(close, fast_spans, slow_spans, mults, cash_bases, initial_cash, initial_size, **kernel):
+    # kernel 为 run_pnl_grid 的其余参数（max_size / spec / check_cash）
+    # 返回 {"dims", "coords", "values"}，values[f, s, m, c] 为对应组合的净盈亏
+    # （资金不足时为 INSUFFICIENT_CASH，与 grid_search 一致）
+    close = np.asarray(close, dtype=np.float64)
+    spans, mat = ema_matrix(close, list(fast_spans) + list(slow_spans))
+    row = {span: k for k, span in enumerate(spans)}
+
+    cash_bases = [float(cb) for cb in cash_bases]
+    batch_bases = cash_bases * len(mults)
+    batch_mults = [m for m in mults for _ in cash_bases]
+    close_list = close.tolist()
+
+    values = np.empty((len(fast_spans), len(slow_spans), len(mults), len(cash_bases)), dtype=np.float64)
+    for a, fast in enumerate(fast_spans):
+        for b, slow in enumerate(slow_spans):
+            signal = signal_array(mat[row[fast]], mat[row[slow]])
+            pnls = run_pnl_grid(close_list, signal, batch_bases, initial_cash, initial_size, batch_mults, **kernel)
+            values[a, b] = np.reshape(pnls, (len(mults), len(cash_bases)))
+
+    return {
+        "dims": SWEEP_DIMS,
+        "coords": {
+            "fast_ema": list(fast_spans),
+            "slow_ema": list(slow_spans),
+            "mult": list(mults),
+            "cash_base": cash_bases,
+        },
+        "values": values,
+    }
+
+
+def sweep_frame(result):
+    # 展开为以各维坐标为 MultiIndex 的 Series
+    # 热力图示例：sweep_frame(r).groupby(level=["fast_ema", "slow_ema"]).median().unstack()
+    index = pd.MultiIndex.from_product([result["coords"][d] for d in result["dims"]], names=result["dims"])
+    return pd.Series(result["values"].ravel(), index=index, name="pnl")